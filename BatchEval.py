@@ -0,0 +1,108 @@
+"""
+Batch evaluation with NumPy, for scoring large numbers of positions (dataset labelling) without a Python loop over
+the squares of every board. The boards are turned into stacked piece planes, one 8x8 plane of 0/1 per piece type,
+and the material and piece-square totals of ChessAI's evaluation are computed for the whole batch with one matrix
+product. The scores are exactly the floats ChessAI.score_board returns for the same positions: the totals are
+integers far below 2**24, so the float32 product is exact, and the score is then formed like score_board forms it.
+"""
+import numpy as np
+
+from ChessEngine import PIECES, PIECE_MATERIAL, PIECE_POSITION_SCORES
+from ChessAI import CHECKMATE, STALEMATE
+
+BATCH_SIZE = 4096  # positions converted to planes at a time, a plane stack takes 768 bytes per position
+
+EMPTY_CODE = len(PIECES)
+PIECE_CODES = {piece: i for i, piece in enumerate(PIECES)}
+PIECE_CODES["--"] = EMPTY_CODE
+# piece code of every two-character square string read as one little-endian uint16, so a whole batch of boards is
+# converted with one lookup instead of a dictionary lookup per square
+SQUARE_CODES = np.full(1 << 16, 255, dtype=np.uint8)
+for piece, code in PIECE_CODES.items():
+    SQUARE_CODES[piece.encode("ascii")[0] | piece.encode("ascii")[1] << 8] = code
+
+# the evaluation tables in plane order, signed like the running totals of GameState (white positive)
+MATERIAL_VALUES = np.array([PIECE_MATERIAL[piece] for piece in PIECES], dtype=np.int64)
+POSITION_TABLES = np.array([PIECE_POSITION_SCORES[piece] for piece in PIECES], dtype=np.int64)
+# weights of the flattened planes, column 0 gives the material total and column 1 the piece-square total
+EVAL_WEIGHTS = np.stack([np.repeat(MATERIAL_VALUES, 64), POSITION_TABLES.reshape(-1)], axis=1).astype(np.float32)
+
+
+'''
+Piece planes of a list of boards (GameState.board lists): a uint8 array of shape (N, 12, 8, 8) where
+planes[n, i, r, c] is 1 if PIECES[i] stands on (r, c) of board n
+'''
+
+
+def board_planes(boards):
+    text = "".join(["".join(row) for board in boards for row in board]).encode("ascii")
+    codes = SQUARE_CODES[np.frombuffer(text, dtype="<u2")]
+    if (codes == 255).any():
+        raise ValueError("unknown piece on a board")
+    codes = codes.reshape(-1, 1, 8, 8)
+    return (codes == np.arange(len(PIECES), dtype=np.uint8).reshape(1, -1, 1, 1)).view(np.uint8)
+
+
+'''
+Material and piece-square totals (int64 arrays, white positive) of a stack of piece planes, the same numbers as
+GameState.compute_eval_scores
+'''
+
+
+def evaluate_planes(planes):
+    totals = planes.reshape(len(planes), -1).astype(np.float32) @ EVAL_WEIGHTS
+    totals = totals.astype(np.int64)
+    return totals[:, 0], totals[:, 1]
+
+
+'''
+Scores of a stack of piece planes, computed like score_board. The optional boolean arrays give the side to move
+and the checkmate and stalemate flags, positions flagged as mate or stalemate get the fixed score. The checkmate
+flags can't be given without white_to_move (ValueError).
+'''
+
+
+def score_planes(planes, white_to_move=None, checkmate=None, stalemate=None):
+    material, position = evaluate_planes(planes)
+    scores = material + position * .1
+    if stalemate is not None:
+        scores[np.asarray(stalemate, dtype=bool)] = STALEMATE
+    if checkmate is not None:
+        if white_to_move is None:
+            raise ValueError("checkmate flags need white_to_move to tell which side is mated")
+        checkmate = np.asarray(checkmate, dtype=bool)
+        white_to_move = np.asarray(white_to_move, dtype=bool)
+        scores[checkmate & white_to_move] = -CHECKMATE  # black wins
+        scores[checkmate & ~white_to_move] = CHECKMATE  # white wins
+    return scores
+
+
+'''
+Scores of a list of GameStates, equal to [ChessAI.score_board(gs) for gs in game_states] as float64 array.
+Works through the list BATCH_SIZE positions at a time so the planes of a huge list are never all in memory.
+'''
+
+
+def score_game_states(game_states, batch_size=BATCH_SIZE):
+    scores = np.empty(len(game_states), dtype=np.float64)
+    for start in range(0, len(game_states), batch_size):
+        batch = game_states[start:start + batch_size]
+        scores[start:start + len(batch)] = score_planes(board_planes([gs.board for gs in batch]),
+                                                        [gs.white_to_move for gs in batch],
+                                                        [gs.checkmate for gs in batch],
+                                                        [gs.stalemate for gs in batch])
+    return scores
+
+
+'''
+Scores of a list of boards (GameState.board lists) with no mate or stalemate flags, as score_board gives for a
+GameState with that board
+'''
+
+
+def score_boards(boards, batch_size=BATCH_SIZE):
+    scores = np.empty(len(boards), dtype=np.float64)
+    for start in range(0, len(boards), batch_size):
+        batch = boards[start:start + batch_size]
+        scores[start:start + len(batch)] = score_planes(board_planes(batch))
+    return scores
@@ -0,0 +1,419 @@
+"""
+Endgame bitbases: whether each position of a small material set (KPK, KRK, KQK, or any other 3 or 4 piece set) is
+won, drawn or lost for the side to move. They are built offline by retrograde analysis: the legal moves of every
+position come from GameState, mates and stalemates are the starting points, and the results are then pushed back
+to earlier positions one move at a time until nothing changes. Positions still undecided at the end are draws.
+Each position takes 2 bits of a packed byte array on disk, and the files are memory-mapped when probed, so the
+search gets a perfect leaf value for a lookup.
+
+A table covers the positions with the stronger side as white, black's side is found by mirroring the board.
+Castling and en passant are left out, neither can happen in these endings (an en passant capture would change
+the material anyway).
+
+Usage:
+    python Bitbase.py                            generate KPK, KRK and KQK in ./bitbases
+    python Bitbase.py KQKR KRKP --directory bitbases
+Tables a capture or promotion leads to are generated first when they are missing. The 3 piece tables take about
+half a minute each, a 4 piece table 20 minutes or more and about 100 MB of memory.
+"""
+import argparse
+from array import array
+import mmap
+import os
+import re
+import sys
+import time
+
+import ChessEngine
+
+BITBASE_DIRECTORY = "bitbases"
+BITBASE_EXTENSION = ".bitbase"
+DEFAULT_MATERIALS = ("KPK", "KRK", "KQK")
+MAX_PIECES = 4
+
+# results, for the side to move
+DRAW = 0
+WIN = 1
+LOSS = 2
+ILLEGAL = 3  # impossible placement, or the side not to move is in check
+UNKNOWN = 4  # only while generating
+
+PIECE_ORDER = "KQRBNP"  # order of the pieces of a side in a material name
+# material sets without a table because nobody can ever be mated
+DRAWN_MATERIALS = {"KK", "KNK", "KKN", "KBK", "KKB"}
+
+
+def _square_targets(offsets):
+    return [[(sq // 8 + dr)*8 + sq % 8 + dc for dr, dc in offsets if 0 <= sq // 8 + dr < 8 and 0 <= sq % 8 + dc < 8]
+            for sq in range(64)]
+
+
+def _square_rays(directions):
+    return [[[(sq // 8 + dr*i)*8 + sq % 8 + dc*i for i in range(1, 8)
+              if 0 <= sq // 8 + dr*i < 8 and 0 <= sq % 8 + dc*i < 8] for dr, dc in directions] for sq in range(64)]
+
+
+# the same offsets as ChessEngine's attack tables, indexed by square (row*8 + col) for the retrograde step
+KNIGHT_SQUARES = _square_targets(((-2, -1), (-2, 1), (2, -1), (2, 1), (1, -2), (1, 2), (-1, -2), (-1, 2)))
+KING_SQUARES = _square_targets(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+ROOK_RAYS = _square_rays(((-1, 0), (0, -1), (1, 0), (0, 1)))
+BISHOP_RAYS = _square_rays(((-1, -1), (-1, 1), (1, -1), (1, 1)))
+QUEEN_RAYS = [ROOK_RAYS[sq] + BISHOP_RAYS[sq] for sq in range(64)]
+
+
+'''
+Material name of a list of (piece, square): white's pieces then black's, each side starting with its king, e.g.
+"KRKP" for white king and rook against black king and pawn
+'''
+
+
+def material_name(pieces):
+    sides = {"w": [], "b": []}
+    for piece, sq in pieces:
+        sides[piece[0]].append(piece[1].upper())
+    return "".join(sorted(sides["w"], key=PIECE_ORDER.index)) + "".join(sorted(sides["b"], key=PIECE_ORDER.index))
+
+
+'''
+Pieces of a material name in table order, e.g. "KRKP" -> ["wK", "wR", "bK", "bp"]
+'''
+
+
+def material_pieces(material):
+    black_start = material.index("K", 1)
+    return ["w" + char if char != "P" else "wp" for char in material[:black_start]] + \
+           ["b" + char if char != "P" else "bp" for char in material[black_start:]]
+
+
+'''
+The same material with the colours swapped, e.g. "KRKP" -> "KPKR"
+'''
+
+
+def flip_material(material):
+    black_start = material.index("K", 1)
+    return material[black_start:] + material[:black_start]
+
+
+'''
+Material sets a capture or a pawn promotion in the given one leads to
+'''
+
+
+def successor_materials(material):
+    pieces = material_pieces(material)
+    successors = set()
+    for i, piece in enumerate(pieces):
+        if piece[1] == "K":
+            continue
+        rest = [(other, 0) for other in pieces[:i] + pieces[i+1:]]
+        successors.add(material_name(rest))
+        if piece[1] == "p":
+            for promotion in "QRBN":
+                successors.add(material_name(rest + [(piece[0] + promotion, 0)]))
+    return sorted(successors)
+
+
+class Bitbase:
+    def __init__(self, path, material):
+        self.path = path
+        self.material = material
+        self.pieces = material_pieces(material)
+        self.piece_types = list(dict.fromkeys(self.pieces))  # identical pieces go in ascending square order
+        with open(path, "rb") as bitbase_file:
+            self.data = mmap.mmap(bitbase_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) * 4 != 2 * 64 ** len(self.pieces):
+            raise ValueError("Bitbase " + path + " has the wrong size for " + material)
+
+    '''
+    Index of a position given as a list of (piece, square) with the material of the table
+    '''
+    def index(self, pieces, white_to_move):
+        squares = {}
+        for piece, sq in pieces:
+            squares.setdefault(piece, []).append(sq)
+        index = 0
+        for piece in self.piece_types:
+            for sq in sorted(squares[piece]):
+                index = index*64 + sq
+        return index*2 + (0 if white_to_move else 1)
+
+    def value(self, index):
+        return self.data[index >> 2] >> ((index & 3) * 2) & 3
+
+    def close(self):
+        self.data.close()
+
+
+'''
+Every bitbase of a directory, probed by the search. max_pieces is the most pieces of any table, positions with
+more pieces don't need to be looked up.
+'''
+
+
+class Bitbases:
+    def __init__(self, directory=None):
+        self.tables = {}
+        self.max_pieces = 0
+        if directory is not None and os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                if name.endswith(BITBASE_EXTENSION):
+                    self.load(os.path.join(directory, name))
+
+    def load(self, path):
+        material = os.path.basename(path)[:-len(BITBASE_EXTENSION)]
+        self.tables[material] = Bitbase(path, material)
+        self.max_pieces = max(self.max_pieces, len(material))
+
+    def has_material(self, material):
+        return material in DRAWN_MATERIALS or material in self.tables or flip_material(material) in self.tables
+
+    '''
+    WIN, DRAW or LOSS for the side to move of gs, None if there is no table for its material or an en passant capture
+    is possible (the tables are built without en passant, it could change the result)
+    '''
+    def probe(self, gs):
+        if gs.en_passant_possible != ():
+            return None
+        pieces = []
+        for r in range(8):
+            for c in range(8):
+                piece = gs.board[r][c]
+                if piece != "--":
+                    pieces.append((piece, r*8 + c))
+        return self.probe_pieces(pieces, gs.white_to_move)
+
+    def probe_pieces(self, pieces, white_to_move):
+        material = material_name(pieces)
+        if material in DRAWN_MATERIALS:
+            return DRAW
+        table = self.tables.get(material)
+        if table is None:
+            table = self.tables.get(flip_material(material))
+            if table is None:
+                return None
+            # mirror the board top to bottom and swap the colours, the result for the side to move stays the same
+            pieces = [(("b" if piece[0] == "w" else "w") + piece[1], sq ^ 56) for piece, sq in pieces]
+            white_to_move = not white_to_move
+        return table.value(table.index(pieces, white_to_move))
+
+
+'''
+Build the bitbase of a material set and write it to directory, generating the tables it depends on first.
+Returns the path of the file.
+'''
+
+
+def generate_bitbase(material, directory=BITBASE_DIRECTORY, bitbases=None, log=print):
+    if bitbases is None:
+        bitbases = Bitbases(directory)
+    for successor in successor_materials(material):
+        if not bitbases.has_material(successor):
+            generate_bitbase(successor, directory, bitbases, log)
+
+    start_time = time.time()
+    pieces = material_pieces(material)
+    piece_count = len(pieces)
+    size = 2 * 64 ** piece_count
+    values = bytearray([UNKNOWN]) * size
+    move_counts = bytearray(size)  # moves of an undecided position not yet known to lose
+    # ranges of identical pieces, which must be in ascending square order for the index to be the table's
+    groups = [(i, i + 1) for i in range(piece_count - 1) if pieces[i] == pieces[i + 1]]
+    white_king = pieces.index("wK")
+    black_king = pieces.index("bK")
+
+    gs = ChessEngine.GameState()
+    gs.board = [["--"] * 8 for r in range(8)]
+    gs.castle_rights = 0
+    gs.en_passant_possible = ()
+    decided = array("I")  # won and lost positions whose predecessors still have to be updated
+    for index in range(size):
+        squares = decode_squares(index >> 1, piece_count)
+        if not placement_possible(pieces, squares, groups):
+            values[index] = ILLEGAL
+            continue
+        white_to_move = index & 1 == 0
+        for piece, sq in zip(pieces, squares):
+            gs.board[sq // 8][sq % 8] = piece
+        gs.white_king_location = divmod(squares[white_king], 8)
+        gs.black_king_location = divmod(squares[black_king], 8)
+        gs.white_to_move = white_to_move
+        waiting_king = gs.black_king_location if white_to_move else gs.white_king_location
+        if gs.square_under_attack(waiting_king[0], waiting_king[1], "b" if white_to_move else "w"):
+            values[index] = ILLEGAL
+        else:
+            moves = gs.get_valid_moves()
+            result = UNKNOWN
+            open_moves = 0
+            if not moves:
+                result = LOSS if gs.in_check else DRAW
+            for move in moves:
+                if move.is_capture or move.pawn_promotion:  # leaves the table, the other one has the answer
+                    successor = bitbases.probe_pieces(moved_pieces(pieces, squares, move), not white_to_move)
+                    if successor == LOSS:
+                        result = WIN
+                        break
+                    if successor == DRAW:
+                        open_moves += 1
+                else:
+                    open_moves += 1
+            if result == UNKNOWN and moves and open_moves == 0:
+                result = LOSS  # every move converts into a lost position
+            if result == UNKNOWN:
+                move_counts[index] = open_moves
+            else:
+                values[index] = result
+                if result != DRAW:
+                    decided.append(index)
+        for sq in squares:
+            gs.board[sq // 8][sq % 8] = "--"
+
+    # retrograde step: a position is won if a move reaches a lost one, lost once every move reaches a won one
+    while decided:
+        index = decided.pop()
+        won = values[index] == WIN
+        for previous in previous_indices(pieces, decode_squares(index >> 1, piece_count), index & 1, groups):
+            if values[previous] != UNKNOWN:
+                continue
+            if not won:
+                values[previous] = WIN
+                decided.append(previous)
+            else:
+                move_counts[previous] -= 1
+                if move_counts[previous] == 0:
+                    values[previous] = LOSS
+                    decided.append(previous)
+
+    values = values.replace(bytes([UNKNOWN]), bytes([DRAW]))
+    packed = bytes(a | b << 2 | c << 4 | d << 6 for a, b, c, d in zip(values[0::4], values[1::4], values[2::4],
+                                                                        values[3::4]))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, material + BITBASE_EXTENSION)
+    with open(path, "wb") as bitbase_file:
+        bitbase_file.write(packed)
+    bitbases.load(path)
+    if log is not None:
+        log("%s: %d won, %d drawn, %d lost, %d illegal in %.1fs" % (
+            material, values.count(WIN), values.count(DRAW), values.count(LOSS), values.count(ILLEGAL),
+            time.time() - start_time))
+    return path
+
+
+def decode_squares(square_index, piece_count):
+    squares = [0] * piece_count
+    for i in range(piece_count - 1, -1, -1):
+        square_index, squares[i] = divmod(square_index, 64)
+    return squares
+
+
+def encode_squares(squares, groups, white_to_move):
+    if groups:
+        squares = list(squares)
+        for i, j in groups:
+            if squares[i] > squares[j]:
+                squares[i], squares[j] = squares[j], squares[i]
+    index = 0
+    for sq in squares:
+        index = index*64 + sq
+    return index*2 + (0 if white_to_move else 1)
+
+
+'''
+False if two pieces share a square, a pawn stands on the first or last rank, or identical pieces are out of order
+(the same position has another index)
+'''
+
+
+def placement_possible(pieces, squares, groups):
+    if len(set(squares)) != len(squares):
+        return False
+    for piece, sq in zip(pieces, squares):
+        if piece[1] == "p" and (sq < 8 or sq >= 56):
+            return False
+    for i, j in groups:
+        if squares[i] > squares[j]:
+            return False
+    return True
+
+
+'''
+The (piece, square) list after a capture or promotion, for looking the position up in another table
+'''
+
+
+def moved_pieces(pieces, squares, move):
+    start = move.start_row*8 + move.start_col
+    end = move.end_row*8 + move.end_col
+    captured = move.start_row*8 + move.end_col if move.en_passant else end
+    result = []
+    for piece, sq in zip(pieces, squares):
+        if sq == start:
+            result.append((piece[0] + move.promotion_piece if move.pawn_promotion else piece, end))
+        elif sq != captured:
+            result.append((piece, sq))
+    return result
+
+
+'''
+Indices of the positions one move before: the side that isn't to move takes back a move that didn't capture or
+promote (those came from other tables). Positions marked illegal are filtered out by the caller's value check.
+'''
+
+
+def previous_indices(pieces, squares, black_to_move, groups):
+    mover = "w" if black_to_move else "b"
+    occupied = set(squares)
+    indices = []
+    for i, piece in enumerate(pieces):
+        if piece[0] != mover:
+            continue
+        sq = squares[i]
+        kind = piece[1]
+        if kind == "K" or kind == "N":
+            origins = [target for target in (KING_SQUARES if kind == "K" else KNIGHT_SQUARES)[sq]
+                       if target not in occupied]
+        elif kind == "p":
+            origins = []
+            step = 8 if mover == "w" else -8  # back towards the pawn's own side
+            origin = sq + step
+            if 8 <= origin < 56 and origin not in occupied:
+                origins.append(origin)
+                start_rank_origin = origin + step
+                if (48 <= start_rank_origin < 56 if mover == "w" else 8 <= start_rank_origin < 16) and \
+                        start_rank_origin not in occupied:
+                    origins.append(start_rank_origin)
+        else:
+            origins = []
+            for ray in (QUEEN_RAYS if kind == "Q" else ROOK_RAYS if kind == "R" else BISHOP_RAYS)[sq]:
+                for target in ray:
+                    if target in occupied:
+                        break
+                    origins.append(target)
+        for origin in origins:
+            squares[i] = origin
+            indices.append(encode_squares(squares, groups, mover == "w"))
+        squares[i] = sq
+    return indices
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate endgame bitbases by retrograde analysis")
+    parser.add_argument("materials", nargs="*", default=list(DEFAULT_MATERIALS),
+                        help="material sets such as KQK or KRKP, white's pieces first")
+    parser.add_argument("--directory", default=BITBASE_DIRECTORY, help="where the .bitbase files are written")
+    args = parser.parse_args(argv)
+
+    bitbases = Bitbases(args.directory)
+    for material in args.materials:
+        if not re.fullmatch("K[QRBNP]*K[QRBNP]*", material) or not 3 <= len(material) <= MAX_PIECES:
+            parser.error("invalid material " + material + ", expected 3 or 4 pieces such as KQK or KRKP")
+        material = material_name([(piece, 0) for piece in material_pieces(material)])
+        if bitbases.has_material(material):
+            print(material + ": already there")
+        else:
+            generate_bitbase(material, args.directory, bitbases)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,537 @@
+"""
+Bitboard version of the GameState. The position is stored in 64-bit integers, one per piece type and colour,
+so move generation and attack detection become mask-and-shift set operations instead of walking the board one
+square at a time. It keeps the same make_move/undo_move/get_valid_moves API (and keeps the 8x8 board in sync),
+so it can be used anywhere a ChessEngine.GameState is expected.
+"""
+
+from ChessEngine import GameState, Move, CAPTURES, QUIETS, CASTLES, ALL_MOVES, WHITE_KINGSIDE, WHITE_QUEENSIDE, \
+    BLACK_KINGSIDE, BLACK_QUEENSIDE, SEE_VALUES, RAYS
+
+# square index = row*8 + col, so bit 0 is a8 and bit 63 is h1 (same orientation as GameState.board)
+SQUARES = [(sq // 8, sq % 8) for sq in range(64)]
+PIECES = ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")
+
+
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+
+def msb(bb):
+    return bb.bit_length() - 1
+
+
+def pop_count(bb):
+    return bin(bb).count("1")
+
+
+def _leaper_attacks(offsets):
+    attacks = []
+    for sq in range(64):
+        r, c = SQUARES[sq]
+        mask = 0
+        for dr, dc in offsets:
+            if 0 <= r + dr < 8 and 0 <= c + dc < 8:
+                mask |= 1 << ((r + dr)*8 + c + dc)
+        attacks.append(mask)
+    return attacks
+
+
+KNIGHT_ATTACKS = _leaper_attacks(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _leaper_attacks(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+# squares attacked by a pawn of the given colour standing on sq
+PAWN_ATTACKS = {"w": _leaper_attacks(((-1, -1), (-1, 1))), "b": _leaper_attacks(((1, -1), (1, 1)))}
+
+# ray directions; the first four increase the square index, the last four decrease it
+ROOK_DIRECTIONS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, -1), (-1, 1))
+
+
+def _ray_masks(directions):
+    rays = []
+    for dr, dc in directions:
+        ray = []
+        for sq in range(64):
+            r, c = SQUARES[sq]
+            mask = 0
+            for i in range(1, 8):
+                if not (0 <= r + dr*i < 8 and 0 <= c + dc*i < 8):
+                    break
+                mask |= 1 << ((r + dr*i)*8 + c + dc*i)
+            ray.append(mask)
+        rays.append(ray)
+    return rays
+
+
+ROOK_RAYS = _ray_masks(ROOK_DIRECTIONS)
+BISHOP_RAYS = _ray_masks(BISHOP_DIRECTIONS)
+ROOK_LINES = [ROOK_RAYS[0][sq] | ROOK_RAYS[1][sq] | ROOK_RAYS[2][sq] | ROOK_RAYS[3][sq] for sq in range(64)]
+
+
+def _between_masks():
+    # BETWEEN[a][b] holds the squares strictly between a and b if they share a line, otherwise 0
+    between = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        r, c = SQUARES[sq]
+        for dr, dc in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            mask = 0
+            for i in range(1, 8):
+                if not (0 <= r + dr*i < 8 and 0 <= c + dc*i < 8):
+                    break
+                end_sq = (r + dr*i)*8 + c + dc*i
+                between[sq][end_sq] = mask
+                mask |= 1 << end_sq
+    return between
+
+
+BETWEEN = _between_masks()
+
+
+def _slider_attacks(sq, occupied, rays):
+    attacks = 0
+    for i in range(2):  # directions that increase the square index, the nearest blocker is the lowest bit
+        ray = rays[i][sq]
+        blockers = ray & occupied
+        attacks |= ray ^ rays[i][lsb(blockers)] if blockers else ray
+    for i in range(2, 4):  # directions that decrease the square index, the nearest blocker is the highest bit
+        ray = rays[i][sq]
+        blockers = ray & occupied
+        attacks |= ray ^ rays[i][msb(blockers)] if blockers else ray
+    return attacks
+
+
+def rook_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, ROOK_RAYS)
+
+
+def bishop_attacks(sq, occupied):
+    return _slider_attacks(sq, occupied, BISHOP_RAYS)
+
+
+SEE_ORDER = ("p", "N", "B", "R", "Q", "K")  # piece types from least to most valuable
+
+
+def _see_ray_index():
+    # index[sq][from_sq] is the index of the ChessEngine.RAYS ray of sq that from_sq is on (8 if none)
+    index = [[8] * 64 for _ in range(64)]
+    for sq in range(64):
+        for j, ray in enumerate(RAYS[sq // 8][sq % 8]):
+            for r, c in ray:
+                index[sq][r*8 + c] = j
+    return index
+
+
+# lets see() choose between two attackers of the same type the way GameState.see does
+SEE_RAY_INDEX = _see_ray_index()
+
+RANK_1 = 0xFF << 56
+RANK_8 = 0xFF
+FULL_BOARD = (1 << 64) - 1
+
+
+class BitboardGameState(GameState):
+    def __init__(self, fen=None):
+        GameState.__init__(self, fen)
+        if fen is None:  # load_fen builds them
+            self.init_bitboards()
+
+    '''
+    Build the bitboards from the 8x8 board
+    '''
+    def init_bitboards(self):
+        self.bitboards = {piece: 0 for piece in PIECES}
+        self.occupancy = {"w": 0, "b": 0}
+        for sq in range(64):
+            r, c = SQUARES[sq]
+            piece = self.board[r][c]
+            if piece != "--":
+                self.bitboards[piece] |= 1 << sq
+                self.occupancy[piece[0]] |= 1 << sq
+
+    def load_fen(self, fen):
+        GameState.load_fen(self, fen)
+        self.init_bitboards()
+
+    def make_move(self, move):
+        GameState.make_move(self, move)
+        self.toggle_move_bits(move)
+
+    def undo_move(self):
+        if len(self.move_log) != 0:
+            move = self.move_log[-1]
+            GameState.undo_move(self)
+            self.toggle_move_bits(move)
+
+    '''
+    XOR the move in or out of the bitboards. XOR is its own inverse, so the same call does and undoes a move.
+    '''
+    def toggle_move_bits(self, move):
+        bitboards = self.bitboards
+        color = move.piece_moved[0]
+        from_bit = 1 << (move.start_row*8 + move.start_col)
+        to_bit = 1 << (move.end_row*8 + move.end_col)
+        bitboards[move.piece_moved] ^= from_bit | to_bit
+        self.occupancy[color] ^= from_bit | to_bit
+        if move.piece_capture != "--":
+            capture_bit = 1 << (move.start_row*8 + move.end_col) if move.en_passant else to_bit
+            bitboards[move.piece_capture] ^= capture_bit
+            self.occupancy[move.piece_capture[0]] ^= capture_bit
+        if move.pawn_promotion:
+            bitboards[move.piece_moved] ^= to_bit
+            bitboards[color + move.promotion_piece] ^= to_bit
+        if move.castle:
+            row = move.end_row*8
+            if move.end_col - move.start_col == 2:  # kingside
+                rook_bits = (1 << (row + 7)) | (1 << (row + 5))
+            else:  # Queenside
+                rook_bits = (1 << row) | (1 << (row + 3))
+            bitboards[color + "R"] ^= rook_bits
+            self.occupancy[color] ^= rook_bits
+
+    '''
+    Bitboard of the pieces of by_color attacking sq, with the given occupancy for the sliders
+    '''
+    def attackers_to(self, sq, by_color, occupied):
+        bitboards = self.bitboards
+        ally_color = "b" if by_color == "w" else "w"
+        rooks = bitboards[by_color + "R"] | bitboards[by_color + "Q"]
+        bishops = bitboards[by_color + "B"] | bitboards[by_color + "Q"]
+        return (KNIGHT_ATTACKS[sq] & bitboards[by_color + "N"]) | \
+               (KING_ATTACKS[sq] & bitboards[by_color + "K"]) | \
+               (PAWN_ATTACKS[ally_color][sq] & bitboards[by_color + "p"]) | \
+               (rook_attacks(sq, occupied) & rooks) | (bishop_attacks(sq, occupied) & bishops)
+
+    def square_under_attack(self, r, c, ally_color, empty_sq=None):
+        enemy_color = "w" if ally_color == "b" else "b"
+        occupied = self.occupancy["w"] | self.occupancy["b"]
+        if empty_sq is not None:
+            occupied &= ~(1 << empty_sq[0]*8 + empty_sq[1])
+        return self.attackers_to(r*8 + c, enemy_color, occupied) != 0
+
+    '''
+    All moves considering checks
+    '''
+    def get_valid_moves(self, moves=None):
+        moves = self.get_legal_moves(ALL_MOVES, moves)
+        if len(moves) == 0:
+            if self.in_check:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+
+        return moves
+
+    '''
+    Legal captures and pawn promotions only, used by the quiescence search
+    '''
+    def get_capture_moves(self, moves=None):
+        return self.get_legal_moves(CAPTURES, moves)
+
+    def get_stage_moves(self, gen_type, moves=None):
+        return self.get_legal_moves(gen_type, moves)
+
+    '''
+    Staged move generation as in GameState.generate_moves, with the check test done on the bitboards
+    '''
+    def generate_moves(self, hash_move_id=0, sort_key=None, moves=None):
+        self.in_check = self.is_in_check()
+        return self.generate_move_stages(hash_move_id, sort_key, moves, self.in_check)
+
+    '''
+    The move with the given id if it is legal in this position, otherwise None. The move is checked against the
+    attack tables and the king's safety after it tested with attackers_to, no moves are generated (except for
+    castling). The king is not in check when this is called.
+    '''
+    def legal_hash_move(self, move_id):
+        start_sq, end_sq = move_id & 63, (move_id >> 6) & 63
+        ally_color, enemy_color = ("w", "b") if self.white_to_move else ("b", "w")
+        start_bit, end_bit = 1 << start_sq, 1 << end_sq
+        if not start_bit & self.occupancy[ally_color] or end_bit & self.occupancy[ally_color]:
+            return None
+        enemy = self.occupancy[enemy_color]
+        occupied = self.occupancy[ally_color] | enemy
+        piece_type = self.board[start_sq // 8][start_sq % 8][1]
+        captured_bit = end_bit & enemy
+        en_passant = False
+        if piece_type == "p":
+            forward = -8 if ally_color == "w" else 8
+            if end_sq == start_sq + forward:
+                legal = not end_bit & occupied
+            elif end_sq == start_sq + 2*forward:
+                legal = start_sq // 8 == (6 if ally_color == "w" else 1) and \
+                    not (end_bit | 1 << (start_sq + forward)) & occupied
+            elif PAWN_ATTACKS[ally_color][start_sq] & end_bit:
+                en_passant = SQUARES[end_sq] == self.en_passant_possible
+                if en_passant:
+                    captured_bit = 1 << (end_sq - forward)
+                legal = captured_bit != 0
+            else:
+                legal = False
+        elif piece_type == "N":
+            legal = KNIGHT_ATTACKS[start_sq] & end_bit
+        elif piece_type == "B":
+            legal = bishop_attacks(start_sq, occupied) & end_bit
+        elif piece_type == "R":
+            legal = rook_attacks(start_sq, occupied) & end_bit
+        elif piece_type == "Q":
+            legal = (rook_attacks(start_sq, occupied) | bishop_attacks(start_sq, occupied)) & end_bit
+        elif abs(end_sq - start_sq) == 2:  # castling
+            castle_moves = []
+            self.get_castle_bitboard_moves(castle_moves, ally_color, enemy_color, start_sq, occupied)
+            for move in castle_moves:
+                if move.move_id == move_id:
+                    return move
+            return None
+        else:
+            legal = KING_ATTACKS[start_sq] & end_bit
+        if not legal:
+            return None
+        move = Move(SQUARES[start_sq], SQUARES[end_sq], self.board, en_passant=en_passant,
+                    promotion_piece=Move.promotion_pieces[move_id >> 12])
+        if move.move_id != move_id:  # promotion bits on a move that isn't a promotion
+            return None
+        # the king may not be left attacked, a captured piece no longer attacks
+        king_sq = end_sq if piece_type == "K" else lsb(self.bitboards[ally_color + "K"])
+        if self.attackers_to(king_sq, enemy_color, occupied ^ start_bit ^ captured_bit | end_bit) & ~captured_bit:
+            return None
+        return move
+
+    '''
+    Static exchange evaluation as in GameState.see, on the bitboards. The attackers of both sides are found at once
+    like in attackers_to, and when a piece has captured it is taken out of the occupancy and the sliders it uncovers
+    on its line are added.
+    '''
+    def see(self, move):
+        sq = move.end_row*8 + move.end_col
+        occupied = (self.occupancy["w"] | self.occupancy["b"]) ^ 1 << (move.start_row*8 + move.start_col)
+        if move.en_passant:
+            occupied ^= 1 << (move.start_row*8 + move.end_col)
+        bitboards = self.bitboards
+        rooks = bitboards["wR"] | bitboards["wQ"] | bitboards["bR"] | bitboards["bQ"]
+        bishops = bitboards["wB"] | bitboards["wQ"] | bitboards["bB"] | bitboards["bQ"]
+        attackers = ((KNIGHT_ATTACKS[sq] & (bitboards["wN"] | bitboards["bN"])) |
+                     (KING_ATTACKS[sq] & (bitboards["wK"] | bitboards["bK"])) |
+                     (PAWN_ATTACKS["b"][sq] & bitboards["wp"]) | (PAWN_ATTACKS["w"][sq] & bitboards["bp"]) |
+                     (rook_attacks(sq, occupied) & rooks) | (bishop_attacks(sq, occupied) & bishops)) & occupied
+        # gains[i] is what the side making capture i wins if the exchange stops after it
+        gains = [SEE_VALUES[move.piece_capture[1]] if move.piece_capture != "--" else 0]
+        if move.pawn_promotion:
+            gains[0] += SEE_VALUES[move.promotion_piece] - SEE_VALUES["p"]
+            on_square = SEE_VALUES[move.promotion_piece]
+        else:
+            on_square = SEE_VALUES[move.piece_moved[1]]
+        color = "b" if move.piece_moved[0] == "w" else "w"
+        while attackers & self.occupancy[color]:
+            for piece_type in SEE_ORDER:  # the least valuable attacker captures
+                pieces = attackers & bitboards[color + piece_type]
+                if pieces:
+                    break
+            bit = pieces & -pieces
+            if pieces != bit and piece_type != "N":  # the same type on several rays, take the lowest ray index
+                ray_index = SEE_RAY_INDEX[sq]
+                while pieces:
+                    other = pieces & -pieces
+                    pieces ^= other
+                    if ray_index[other.bit_length() - 1] < ray_index[bit.bit_length() - 1]:
+                        bit = other
+            occupied ^= bit
+            if piece_type != "N":  # a piece on a line to the square may have a slider behind it
+                if bit & ROOK_LINES[sq]:
+                    attackers |= rook_attacks(sq, occupied) & rooks
+                else:
+                    attackers |= bishop_attacks(sq, occupied) & bishops
+            attackers &= occupied
+            gains.append(on_square - gains[-1])
+            on_square = SEE_VALUES[piece_type]
+            color = "b" if color == "w" else "w"
+        # each side only recaptures when that is better than stopping
+        while len(gains) > 1:
+            gain = gains.pop()
+            gains[-1] = -max(-gains[-1], gain)
+        return gains[0]
+
+    def has_legal_move(self):
+        # castling is left out, if it is legal so is the king's step towards the rook
+        return len(self.get_legal_moves(CAPTURES | QUIETS, first_only=True)) != 0
+
+    def is_in_check(self):
+        ally_color, enemy_color = ("w", "b") if self.white_to_move else ("b", "w")
+        return self.attackers_to(lsb(self.bitboards[ally_color + "K"]), enemy_color,
+                                 self.occupancy["w"] | self.occupancy["b"]) != 0
+
+    '''
+    Generate the legal moves of the kinds in gen_type (CAPTURES, QUIETS, CASTLES or a combination) into moves (a new
+    list unless one is given). With first_only it returns as soon as one piece has a move. Also sets self.in_check.
+    '''
+    def get_legal_moves(self, gen_type=ALL_MOVES, moves=None, first_only=False):
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+        bitboards = self.bitboards
+        board = self.board
+        if self.white_to_move:
+            ally_color, enemy_color, forward = "w", "b", -8
+            start_rank, promotion_rank = 0xFF << 48, RANK_8
+        else:
+            ally_color, enemy_color, forward = "b", "w", 8
+            start_rank, promotion_rank = 0xFF << 8, RANK_1
+        own = self.occupancy[ally_color]
+        enemy = self.occupancy[enemy_color]
+        occupied = own | enemy
+        empty = FULL_BOARD ^ occupied
+        king_bit = bitboards[ally_color + "K"]
+        king_sq = lsb(king_bit)
+        king_start = SQUARES[king_sq]
+
+        checkers = self.attackers_to(king_sq, enemy_color, occupied)
+        self.in_check = checkers != 0
+
+        to_squares = 0
+        if gen_type & CAPTURES:
+            to_squares |= enemy
+        if gen_type & QUIETS:
+            to_squares |= empty
+        pawn_targets = enemy  # squares the pawns capture on
+        if not gen_type & CAPTURES:  # no pawn captures or promotions either
+            pawn_targets = 0
+            empty &= ~promotion_rank
+        elif not gen_type & QUIETS:  # promotions count as captures, the other pawn pushes are left out
+            empty &= promotion_rank
+            start_rank = 0
+
+        # king moves, the king itself is taken off the board so it can't hide behind itself on a slider's ray
+        targets = KING_ATTACKS[king_sq] & ~own & to_squares
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            sq = bit.bit_length() - 1
+            if not self.attackers_to(sq, enemy_color, occupied ^ king_bit):
+                moves.append(Move(king_start, SQUARES[sq], board))
+        if first_only and moves:
+            return moves
+
+        if checkers & (checkers - 1) == 0:  # not in double check, other pieces can move
+            if to_squares:  # only castling is left otherwise
+                if checkers:  # capture the checking piece or block the check
+                    check_mask = checkers | BETWEEN[king_sq][lsb(checkers)]
+                else:
+                    check_mask = FULL_BOARD
+
+                # pinned pieces may only move along the line between the king and the pinning piece
+                pin_masks = {}
+                enemy_rooks = bitboards[enemy_color + "R"] | bitboards[enemy_color + "Q"]
+                enemy_bishops = bitboards[enemy_color + "B"] | bitboards[enemy_color + "Q"]
+                snipers = (rook_attacks(king_sq, enemy) & enemy_rooks) | \
+                          (bishop_attacks(king_sq, enemy) & enemy_bishops)
+                while snipers:
+                    bit = snipers & -snipers
+                    snipers ^= bit
+                    sniper_sq = bit.bit_length() - 1
+                    blockers = BETWEEN[king_sq][sniper_sq] & occupied
+                    if blockers and blockers & (blockers - 1) == 0 and blockers & own:
+                        pin_masks[lsb(blockers)] = BETWEEN[king_sq][sniper_sq] | bit
+
+                self.get_pawn_bitboard_moves(moves, ally_color, enemy_color, forward, start_rank, pawn_targets, empty,
+                                             occupied, king_sq, check_mask, pin_masks)
+                if first_only and moves:
+                    return moves
+                target_mask = ~own & check_mask & to_squares
+                for piece_type in ("N", "B", "R", "Q"):
+                    pieces = bitboards[ally_color + piece_type]
+                    while pieces:
+                        bit = pieces & -pieces
+                        pieces ^= bit
+                        sq = bit.bit_length() - 1
+                        if piece_type == "N":
+                            targets = KNIGHT_ATTACKS[sq]
+                        elif piece_type == "B":
+                            targets = bishop_attacks(sq, occupied)
+                        elif piece_type == "R":
+                            targets = rook_attacks(sq, occupied)
+                        else:
+                            targets = rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+                        targets &= target_mask
+                        if sq in pin_masks:
+                            targets &= pin_masks[sq]
+                        start = SQUARES[sq]
+                        while targets:
+                            bit = targets & -targets
+                            targets ^= bit
+                            moves.append(Move(start, SQUARES[bit.bit_length() - 1], board))
+                        if first_only and moves:
+                            return moves
+
+            if not checkers and gen_type & CASTLES:
+                self.get_castle_bitboard_moves(moves, ally_color, enemy_color, king_sq, occupied)
+
+        return moves
+
+    '''
+    Add the legal pawn moves, including en passant, to the list
+    '''
+    def get_pawn_bitboard_moves(self, moves, ally_color, enemy_color, forward, start_rank, enemy, empty, occupied,
+                                king_sq, check_mask, pin_masks):
+        board = self.board
+        pawn_attacks = PAWN_ATTACKS[ally_color]
+        if self.en_passant_possible != ():
+            en_passant_sq = self.en_passant_possible[0]*8 + self.en_passant_possible[1]
+            en_passant_bit = 1 << en_passant_sq
+        else:
+            en_passant_sq = -1
+            en_passant_bit = 0
+
+        if not enemy:  # captures are not being generated
+            en_passant_bit = 0
+        pawns = self.bitboards[ally_color + "p"]
+        while pawns:
+            bit = pawns & -pawns
+            pawns ^= bit
+            sq = bit.bit_length() - 1
+            allowed = check_mask & pin_masks.get(sq, FULL_BOARD)
+            start = SQUARES[sq]
+            one_step = sq + forward
+            if (1 << one_step) & empty:
+                if (1 << one_step) & allowed:
+                    self.add_pawn_move(start, SQUARES[one_step], moves)
+                two_steps = one_step + forward
+                if bit & start_rank and (1 << two_steps) & empty & allowed:
+                    moves.append(Move(start, SQUARES[two_steps], board))
+            targets = pawn_attacks[sq] & enemy & allowed
+            while targets:
+                target_bit = targets & -targets
+                targets ^= target_bit
+                self.add_pawn_move(start, SQUARES[target_bit.bit_length() - 1], moves)
+            if pawn_attacks[sq] & en_passant_bit:
+                # take both pawns off and see if anything now attacks the king
+                captured_bit = 1 << (en_passant_sq - forward)
+                occupied_after = occupied ^ bit ^ captured_bit ^ en_passant_bit
+                bitboards = self.bitboards
+                enemy_rooks = bitboards[enemy_color + "R"] | bitboards[enemy_color + "Q"]
+                enemy_bishops = bitboards[enemy_color + "B"] | bitboards[enemy_color + "Q"]
+                if not (rook_attacks(king_sq, occupied_after) & enemy_rooks) and \
+                        not (bishop_attacks(king_sq, occupied_after) & enemy_bishops) and \
+                        not (KNIGHT_ATTACKS[king_sq] & bitboards[enemy_color + "N"]) and \
+                        not (PAWN_ATTACKS[ally_color][king_sq] & (bitboards[enemy_color + "p"] ^ captured_bit)):
+                    moves.append(Move(start, SQUARES[en_passant_sq], board, en_passant=True))
+
+    '''
+    Add the castle moves to the list, the king is not in check when this is called
+    '''
+    def get_castle_bitboard_moves(self, moves, ally_color, enemy_color, king_sq, occupied):
+        if ally_color == "w":
+            kingside, queenside = self.castle_rights & WHITE_KINGSIDE, self.castle_rights & WHITE_QUEENSIDE
+        else:
+            kingside, queenside = self.castle_rights & BLACK_KINGSIDE, self.castle_rights & BLACK_QUEENSIDE
+        start = SQUARES[king_sq]
+        if kingside and not occupied & ((1 << (king_sq + 1)) | (1 << (king_sq + 2))) and \
+                not self.attackers_to(king_sq + 1, enemy_color, occupied) and \
+                not self.attackers_to(king_sq + 2, enemy_color, occupied):
+            moves.append(Move(start, SQUARES[king_sq + 2], self.board, castle=True))
+        if queenside and not occupied & ((1 << (king_sq - 1)) | (1 << (king_sq - 2)) | (1 << (king_sq - 3))) and \
+                not self.attackers_to(king_sq - 1, enemy_color, occupied) and \
+                not self.attackers_to(king_sq - 2, enemy_color, occupied):
+            moves.append(Move(start, SQUARES[king_sq - 2], self.board, castle=True))
@@ -1,67 +1,66 @@
+import multiprocessing
+import os
+import queue
 import random
+import time
+from TranspositionTable import TranspositionTable, SharedTranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND, NO_MOVE
+from OpeningBook import open_book
+from Bitbase import Bitbases, BITBASE_DIRECTORY, WIN, LOSS, DRAW
+from PieceScores import pieces_score
 
-pieces_score = {"K": 0, "Q": 8, "R": 5, "B": 3, "N": 3, "p": 1}
-
-knight_scores = [[1, 1, 1, 1, 1, 1, 1, 1],
-                 [1, 2, 2, 2, 2, 2, 2, 1],
-                 [1, 2, 3, 3, 3, 3, 2, 1],
-                 [1, 2, 3, 4, 4, 3, 2, 1],
-                 [1, 2, 3, 4, 4, 3, 2, 1],
-                 [1, 2, 3, 3, 3, 3, 2, 1],
-                 [1, 2, 2, 2, 2, 2, 2, 1],
-                 [1, 1, 1, 1, 1, 1, 1, 1]]
-
-bishop_scores = [[4, 3, 2, 1, 1, 2, 3, 4],
-                 [3, 4, 3, 2, 2, 3, 4, 3],
-                 [2, 3, 4, 3, 3, 4, 3, 2],
-                 [1, 2, 3, 4, 4, 3, 2, 1],
-                 [1, 2, 3, 4, 4, 3, 2, 1],
-                 [2, 3, 4, 3, 3, 4, 3, 2],
-                 [3, 4, 3, 2, 2, 3, 4, 3],
-                 [4, 3, 2, 1, 1, 2, 3, 4]]
-
-queen_scores = [[1, 1, 1, 3, 1, 1, 1, 1],
-                [1, 2, 3, 3, 3, 1, 1, 1],
-                [1, 4, 3, 3, 3, 4, 2, 1],
-                [1, 2, 3, 3, 3, 2, 2, 1],
-                [1, 2, 3, 3, 3, 2, 2, 1],
-                [1, 4, 3, 3, 3, 4, 2, 1],
-                [1, 1, 2, 3, 3, 1, 1, 1],
-                [1, 1, 1, 3, 1, 1, 1, 1]]
-
-# probably better to try to place rooks on open files, or on same file as rook/queen
-rook_scores = [[4, 3, 4, 4, 4, 4, 3, 4],
-               [4, 4, 4, 4, 4, 4, 4, 4],
-               [1, 1, 2, 3, 3, 2, 1, 1],
-               [1, 2, 3, 4, 4, 3, 2, 1],
-               [1, 2, 3, 4, 4, 3, 2, 1],
-               [1, 1, 2, 3, 3, 2, 1, 1],
-               [4, 4, 4, 4, 4, 4, 4, 4],
-               [4, 3, 4, 4, 4, 4, 3, 4]]
-
-white_pawn_scores = [[8, 8, 8, 8, 8, 8, 8, 8],
-                     [8, 8, 8, 8, 8, 8, 8, 8],
-                     [5, 6, 6, 7, 7, 6, 6, 5],
-                     [2, 3, 3, 5, 5, 3, 3, 2],
-                     [1, 2, 3, 4, 4, 3, 2, 1],
-                     [1, 1, 2, 3, 3, 2, 1, 1],
-                     [1, 1, 1, 0, 0, 1, 1, 1],
-                     [0, 0, 0, 0, 0, 0, 0, 0]]
-
-black_pawn_scores = [[0, 0, 0, 0, 0, 0, 0, 0],
-                     [1, 1, 1, 0, 0, 1, 1, 1],
-                     [1, 1, 2, 3, 3, 2, 1, 1],
-                     [1, 2, 3, 4, 4, 3, 2, 1],
-                     [2, 3, 3, 5, 5, 3, 3, 2],
-                     [5, 6, 6, 7, 7, 6, 6, 5],
-                     [8, 8, 8, 8, 8, 8, 8, 8],
-                     [8, 8, 8, 8, 8, 8, 8, 8]]
-
-piece_position_scores = {"N": knight_scores, "Q": queen_scores, "B": bishop_scores, "R": rook_scores,
-                         "bp": black_pawn_scores, "wp": white_pawn_scores}
 CHECKMATE = 1000
 STALEMATE = 0
-DEPTH = 4
+DEPTH = 4  # default depth when no time or node budget is given
+MAX_DEPTH = 64  # deepest iteration when searching on a time or node budget
+# The search scores being mated ply plies from the root as -(CHECKMATE - ply), so a shorter mate scores higher and
+# CHECKMATE - abs(score) is the distance to the mate. Anything beyond MATE_THRESHOLD is a mate score.
+MATE_THRESHOLD = CHECKMATE - 200
+CHECK_LIMITS_EVERY = 1024  # nodes between checks of the clock and of the stop request
+HASH_SIZE_MB = 16  # memory used by the transposition table
+DELTA_MARGIN = 2  # quiescence search skips captures that can't bring the score within this much of alpha
+
+# search reductions, see find_move_negamax_alpha_beta
+NULL_MOVE_PRUNING = True
+NULL_MOVE_REDUCTION = 2  # the null move is searched this much shallower than a normal move
+NULL_MOVE_MIN_DEPTH = 3
+LATE_MOVE_REDUCTIONS = True
+LMR_MIN_DEPTH = 3
+LMR_FULL_DEPTH_MOVES = 3  # moves searched at full depth before the late quiet moves get reduced
+LMR_REDUCTION = 1
+NULL_WINDOW = .01  # scores move in steps of .1, so (alpha, alpha + NULL_WINDOW) holds no score
+ASPIRATION_WINDOW = .5  # the root is searched this far either side of the last iteration's score
+ASPIRATION_MIN_DEPTH = 3  # shallower iterations use the full window
+
+BOOK_PATH = "book.bin"  # Polyglot opening book, the engine searches every move when the file isn't there
+BITBASE_PATH = BITBASE_DIRECTORY  # endgame bitbases made with Bitbase.py, probed when the directory exists
+BITBASE_WIN = 500  # score of a won bitbase position, before the terms that make the search progress to mate
+
+transposition_table = TranspositionTable(HASH_SIZE_MB)
+opening_book = open_book(BOOK_PATH)
+bitbases = Bitbases(BITBASE_PATH)
+
+# move ordering, see order_moves
+HASH_MOVE_SCORE = 1000000000
+CAPTURE_SCORE = 100000000
+KILLER_SCORE = 90000000
+LOSING_CAPTURE_SCORE = 80000000  # captures that lose material by static exchange evaluation go after the killers
+killer_moves = [[NO_MOVE, NO_MOVE] for ply in range(MAX_DEPTH + 1)]  # two quiet moves per ply that caused a cutoff
+history_table = {piece: [0] * 64 for piece in ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")}
+move_buffers = [[] for ply in range(MAX_DEPTH + 1)]  # one reusable move list per ply, see move_buffer
+
+# state of the current search
+next_move = None
+nodes = 0  # nodes visited by the current search
+search_stopped = False
+deadline = None
+max_nodes = None
+stop_callback = None
+completed_depth = 0
+iteration_results = []  # (depth, best move, score) of every completed iteration
+worker_stop_event = None  # set in the worker processes of a parallel search
+worker_report_queue = None  # where the worker processes of a parallel search report their iterations
+search_pool = None  # (pool, workers, stop event, report queue, table memory) of the parallel search
+search_count = 0  # numbers the parallel searches, so a late report of an earlier one is told apart
 
 
 def find_random_move(valid_moves):
@@ -102,16 +101,317 @@ def find_best_move1(gs, valid_moves):
 
 
 '''
-Helper method to make first recursive call
+Helper method to make first recursive call. A move from the opening book is played without searching when the
+position is in it, unless use_book is False. iteration_callback(depth, best move, score) is called after each
+completed iteration.
 '''
 
 
-def find_best_move(gs, valid_moves, return_queue):
-    global next_move, counter
+def find_best_move(gs, valid_moves, return_queue=None, time_limit=None, node_limit=None, max_depth=DEPTH,
+                   stop_check=None, workers=1, use_book=True, iteration_callback=None):
+    global next_move, nodes, search_stopped, deadline, max_nodes, stop_callback, completed_depth
+    if use_book and opening_book is not None:
+        book_move = opening_book.find_move(gs, valid_moves)
+        if book_move is not None:  # no search, so no nodes and no completed iteration
+            nodes = 0
+            completed_depth = 0
+            iteration_results.clear()
+            if return_queue is not None:
+                return_queue.put(book_move)
+            return book_move
+    if workers > 1 and len(valid_moves) > 1:
+        return find_best_move_parallel(gs, valid_moves, workers, return_queue, time_limit, node_limit, max_depth,
+                                       stop_check, iteration_callback)
     next_move = None
+    best_move = None
     random.shuffle(valid_moves)
-    find_move_negamax_alpha_beta(gs, valid_moves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.white_to_move else -1)
-    return_queue.put(next_move)
+    nodes = 0
+    search_stopped = False
+    deadline = time.time() + time_limit if time_limit is not None else None
+    max_nodes = node_limit
+    stop_callback = stop_check
+    completed_depth = 0
+    iteration_results.clear()
+    clear_move_ordering()
+    turn_multiplier = 1 if gs.white_to_move else -1
+    # iterative deepening, only the result of a completed iteration is used
+    for depth in range(1, max_depth + 1):
+        if depth >= ASPIRATION_MIN_DEPTH and iteration_results:
+            score = search_aspiration_window(gs, valid_moves, depth, iteration_results[-1][2], turn_multiplier)
+        else:
+            next_move = None
+            score = find_move_negamax_alpha_beta(gs, valid_moves, depth, -CHECKMATE, CHECKMATE, turn_multiplier)
+        if search_stopped:
+            break
+        best_move = next_move
+        completed_depth = depth
+        iteration_results.append((depth, best_move, score))
+        if iteration_callback is not None:
+            iteration_callback(depth, best_move, score)
+        if abs(score) >= MATE_THRESHOLD:  # found a forced mate, searching deeper won't change the move
+            break
+        check_search_limits()
+        if search_stopped:
+            break
+    if return_queue is not None:
+        return_queue.put(best_move)
+    return best_move
+
+
+'''
+Search the root with a small window around the score of the previous iteration. When the score falls outside, the
+side it failed on is widened and the root searched again, until the score lands inside the window.
+'''
+
+
+def search_aspiration_window(gs, valid_moves, depth, previous_score, turn_multiplier):
+    global next_move
+    window = ASPIRATION_WINDOW
+    alpha = max(previous_score - window, -CHECKMATE)
+    beta = min(previous_score + window, CHECKMATE)
+    while True:
+        next_move = None
+        score = find_move_negamax_alpha_beta(gs, valid_moves, depth, alpha, beta, turn_multiplier)
+        if search_stopped:
+            return score
+        window *= 2
+        if score <= alpha and alpha > -CHECKMATE:
+            alpha = max(score - window, -CHECKMATE)
+        elif score >= beta and beta < CHECKMATE:
+            beta = min(score + window, CHECKMATE)
+        else:
+            return score
+
+
+'''
+Search on several processes with Lazy SMP: every worker runs the normal iterative deepening search on the whole
+position, and they share one transposition table in shared memory, so each one finds the results the others stored
+and they end up splitting the work between them. The root move order is shuffled differently in each worker, which
+spreads them over the tree. Worker 0 is the main search, when it finishes the helpers are stopped, and the result
+of the worker that completed the deepest iteration is played (the main one on a tie). The worker processes are kept
+in a pool between searches, they get the position as a FEN string and the ids of the root moves. The workers report
+every completed iteration while they search, each new deepest one is passed on to iteration_callback.
+'''
+
+
+def find_best_move_parallel(gs, valid_moves, workers, return_queue=None, time_limit=None, node_limit=None,
+                            max_depth=DEPTH, stop_check=None, iteration_callback=None):
+    global nodes, completed_depth, search_count
+    # the pool is started before the search is timed, the workers start their clocks when they get the position
+    pool, stop_event, report_queue = get_search_pool(workers)
+    stop_event.clear()
+    search_count += 1
+    moves_by_id = {move.move_id: move for move in valid_moves}
+    worker_node_limit = node_limit // workers if node_limit is not None else None
+    search_args = (search_count, type(gs), gs.get_fen(), list(moves_by_id), time_limit, worker_node_limit, max_depth)
+    searches = [pool.apply_async(search_worker, search_args) for i in range(workers)]
+    nodes = 0
+    worker_nodes = {}  # nodes searched so far by each worker process
+    reported_depth = 0
+    while not all(search.ready() for search in searches):
+        searches[0].wait(0.01)
+        if not stop_event.is_set() and (searches[0].ready() or (stop_check is not None and stop_check())):
+            stop_event.set()
+        while True:
+            try:
+                report_id, worker, depth, move_id, score, searched = report_queue.get_nowait()
+            except queue.Empty:
+                break
+            if report_id != search_count:
+                continue
+            worker_nodes[worker] = searched
+            nodes = sum(worker_nodes.values())
+            if depth > reported_depth:
+                reported_depth = depth
+                if iteration_callback is not None:
+                    iteration_callback(depth, moves_by_id[move_id], score)
+    worker_results = [search.get() for search in searches]
+
+    nodes = sum(searched for results, searched in worker_results)
+    # the deepest completed iteration, max keeps the first so the main search wins a tie
+    results = max((results for results, searched in worker_results),
+                  key=lambda results: results[-1][0] if results else 0)
+    iteration_results[:] = [(depth, moves_by_id[move_id], score) for depth, move_id, score in results]
+    best_move = None
+    completed_depth = 0
+    if iteration_results:
+        completed_depth, best_move, best_score = iteration_results[-1]
+        # a report still in the queue when the workers finished
+        if completed_depth > reported_depth and iteration_callback is not None:
+            iteration_callback(completed_depth, best_move, best_score)
+    if return_queue is not None:
+        return_queue.put(best_move)
+    return best_move
+
+
+'''
+The pool of search processes for workers, started on first use and kept for the next searches. The transposition
+table is moved to shared memory first, the pool is started again when the number of workers or the table changes.
+'''
+
+
+def get_search_pool(workers):
+    global transposition_table, search_pool
+    if not isinstance(transposition_table, SharedTranspositionTable):
+        transposition_table = SharedTranspositionTable(transposition_table.size_mb)
+    if search_pool is not None and (search_pool[1] != workers or
+                                    search_pool[4] is not transposition_table.shared_keys):
+        close_search_pool()
+    if search_pool is None:
+        stop_event = multiprocessing.Event()
+        report_queue = multiprocessing.Queue()
+        pool = multiprocessing.Pool(workers, initializer=init_search_worker,
+                                    initargs=(stop_event, report_queue, transposition_table.size_mb,
+                                              transposition_table.shared_keys, transposition_table.shared_data))
+        search_pool = (pool, workers, stop_event, report_queue, transposition_table.shared_keys)
+    return search_pool[0], search_pool[2], search_pool[3]
+
+
+def close_search_pool():
+    global search_pool
+    if search_pool is not None:
+        search_pool[0].terminate()
+        search_pool[0].join()
+        search_pool = None
+
+
+def init_search_worker(stop_event, report_queue, table_size_mb, shared_keys, shared_data):
+    global worker_stop_event, worker_report_queue, transposition_table
+    worker_stop_event = stop_event
+    worker_report_queue = report_queue
+    transposition_table = SharedTranspositionTable(table_size_mb, shared_keys, shared_data)
+    random.seed()  # forked workers would all shuffle the root moves the same way
+
+
+'''
+Runs in a worker process of find_best_move_parallel, returns the iteration results (with move ids, not moves) and
+the node count. Each completed iteration is also put on the report queue as it finishes.
+'''
+
+
+def search_worker(search_id, state_class, fen, root_move_ids, time_limit, node_limit, max_depth):
+    def report_iteration(depth, move, score):
+        if move is not None:
+            worker_report_queue.put((search_id, os.getpid(), depth, move.move_id, score, nodes))
+
+    gs = state_class(fen)
+    moves = [move for move in gs.get_valid_moves() if move.move_id in root_move_ids]
+    find_best_move(gs, moves, None, time_limit, node_limit, max_depth, worker_stop_event.is_set, use_book=False,
+                   iteration_callback=report_iteration)
+    return [(depth, move.move_id, score) for depth, move, score in iteration_results if move is not None], nodes
+
+
+'''
+Called every CHECK_LIMITS_EVERY nodes, stops the search when the time or node budget is used up or a stop is requested.
+The first iteration is always finished (except on a stop request) so there is a move to play.
+'''
+
+
+def check_search_limits():
+    global search_stopped
+    if stop_callback is not None and stop_callback():
+        search_stopped = True
+    elif completed_depth > 0:
+        if (deadline is not None and time.time() >= deadline) or (max_nodes is not None and nodes >= max_nodes):
+            search_stopped = True
+
+
+'''
+The line of play the search expects from gs, following the best moves stored in the transposition table. Stops at
+max_length moves, at a position without a stored move, and when a position repeats.
+'''
+
+
+def principal_variation(gs, max_length):
+    pv = []
+    seen_keys = set()
+    while len(pv) < max_length and gs.zobrist_key not in seen_keys:
+        seen_keys.add(gs.zobrist_key)
+        entry = transposition_table.probe(gs.zobrist_key)
+        if entry is None or entry[3] == NO_MOVE:
+            break
+        move = next((move for move in gs.get_valid_moves() if move.move_id == entry[3]), None)
+        if move is None:  # another position with the same table slot
+            break
+        pv.append(move)
+        gs.make_move(move)
+    for move in pv:
+        gs.undo_move()
+    return pv
+
+
+'''
+Order moves so the ones most likely to cause a cutoff are searched first: the hash move, then captures by most
+valuable victim / least valuable attacker, then the killer moves of this ply, then the rest by history score.
+When gs is given, captures that lose material by GameState.see are put after the killers.
+'''
+
+
+def order_moves(moves, hash_move_id, ply, gs=None):
+    moves.sort(key=move_order_key(hash_move_id, ply, gs), reverse=True)  # in place, the list is the move buffer of the ply
+    return moves
+
+
+'''
+The sort key used by order_moves, also given to GameState.generate_moves to order each stage
+'''
+
+
+def move_order_key(hash_move_id, ply, gs=None):
+    killers = killer_moves[ply]
+
+    def move_order_score(move):
+        if move.move_id == hash_move_id:
+            return HASH_MOVE_SCORE
+        if move.is_capture:
+            # only a capture by a piece worth more than its victim can lose material
+            if gs is not None and pieces_score[move.piece_moved[1]] > pieces_score[move.piece_capture[1]]:
+                exchange = gs.see(move)
+                if exchange < 0:
+                    return LOSING_CAPTURE_SCORE + exchange
+            return CAPTURE_SCORE + pieces_score[move.piece_capture[1]] * 10 - pieces_score[move.piece_moved[1]]
+        if move.pawn_promotion:
+            return CAPTURE_SCORE + pieces_score[move.promotion_piece] * 10
+        if move.move_id == killers[0]:
+            return KILLER_SCORE + 1
+        if move.move_id == killers[1]:
+            return KILLER_SCORE
+        return history_table[move.piece_moved][move.end_row*8 + move.end_col]
+
+    return move_order_score
+
+
+'''
+Remember a quiet move that caused a beta cutoff as a killer for its ply and in the history table
+'''
+
+
+def update_move_ordering(move, depth, ply):
+    killers = killer_moves[ply]
+    if killers[0] != move.move_id:
+        killers[1] = killers[0]
+        killers[0] = move.move_id
+    history_table[move.piece_moved][move.end_row*8 + move.end_col] += depth * depth
+
+
+'''
+The move list of a ply. A ply's moves are only needed until the search returns from it, so the lists are reused
+instead of allocating new ones at every node. The quiescence search can go past MAX_DEPTH, more lists are added then.
+'''
+
+
+def move_buffer(ply):
+    while len(move_buffers) <= ply:
+        move_buffers.append([])
+    return move_buffers[ply]
+
+
+def clear_move_ordering():
+    for killers in killer_moves:
+        killers[0] = killers[1] = NO_MOVE
+    for scores in history_table.values():
+        for i in range(64):
+            scores[i] = 0
 
 
 def find_move_minmax(gs, valid_moves, depth, white_to_move):
@@ -164,30 +464,216 @@ def find_move_negamax(gs, valid_moves, depth, turn_multiplier):
     return max_score
 
 
-def find_move_negamax_alpha_beta(gs, valid_moves, depth, alpha, beta, turn_multiplier):
-    global next_move
+'''
+Alpha-beta search. valid_moves is the move list to search at the root, the other nodes get None and generate their
+moves lazily with GameState.generate_moves.
+Principal variation search: the first move gets the full window, the rest a null window that only shows whether they
+beat alpha, and a move that does is searched again with the full window.
+Null move pruning: if the side to move can pass and a reduced search still fails high, the node is cut. Not used in
+check, right after another null move or with only king and pawns left (zugzwang).
+Late move reductions: quiet moves ordered after the first LMR_FULL_DEPTH_MOVES are searched one ply shallower with a
+null window first, and again at full depth if they beat alpha.
+'''
+
+
+def find_move_negamax_alpha_beta(gs, valid_moves, depth, alpha, beta, turn_multiplier, ply=0, allow_null=True):
+    global next_move, nodes
+    nodes += 1
+    if nodes % CHECK_LIMITS_EVERY == 0:
+        check_search_limits()
+    # with few pieces left the bitbases know the result. A draw ends the line right away, a win or loss is scored at
+    # the leaves only so the search still sees the mates within its depth. The root is searched so next_move gets set.
+    if ply != 0 and gs.piece_count <= bitbases.max_pieces:
+        result = bitbases.probe(gs)
+        if result is not None and (depth == 0 or result == DRAW):
+            return bitbase_score(gs, result, turn_multiplier, ply)
     if depth == 0:
-        return turn_multiplier * score_board(gs)
+        return quiescence_search(gs, alpha, beta, turn_multiplier, ply)
+
+    # transposition table lookup, the root always searches so next_move gets set
+    original_alpha = alpha
+    hash_move_id = NO_MOVE
+    entry = transposition_table.probe(gs.zobrist_key)
+    if entry is not None:
+        entry_depth, entry_score, bound, hash_move_id = entry
+        entry_score = score_from_table(entry_score, ply)
+        if entry_depth >= depth and ply != 0:
+            if bound == EXACT:
+                transposition_table.cutoffs += 1
+                return entry_score
+            elif bound == LOWER_BOUND:
+                alpha = max(alpha, entry_score)
+            elif bound == UPPER_BOUND:
+                beta = min(beta, entry_score)
+            if alpha >= beta:
+                transposition_table.cutoffs += 1
+                return entry_score
+
+    if NULL_MOVE_PRUNING and allow_null and ply != 0 and depth >= NULL_MOVE_MIN_DEPTH and beta < MATE_THRESHOLD and \
+            not gs.is_in_check() and gs.has_non_pawn_material() and turn_multiplier * score_board(gs) >= beta:
+        gs.make_null_move()
+        score = -find_move_negamax_alpha_beta(gs, None, depth-1-NULL_MOVE_REDUCTION, -beta, -beta + NULL_WINDOW,
+                                              -turn_multiplier, ply+1, False)
+        gs.undo_null_move()
+        if search_stopped:
+            return 0
+        if score >= beta:
+            return beta  # don't trust a mate score found by passing
 
-    # move ordering - implement later
     max_score = -CHECKMATE
-    for move in valid_moves:
+    best_move_id = NO_MOVE
+    if valid_moves is None:  # pull the moves stage by stage, a cutoff skips generating the rest
+        moves = gs.generate_moves(hash_move_id, move_order_key(hash_move_id, ply, gs), move_buffer(ply))
+    else:
+        moves = order_moves(valid_moves, hash_move_id, ply, gs)
+    # generate_moves sets gs.in_check, the root gets its moves passed in so it has to look itself
+    in_check = gs.is_in_check() if valid_moves is not None else gs.in_check
+    moves_searched = 0
+    for move in moves:
+        moves_searched += 1
         gs.make_move(move)
-        next_moves = gs.get_valid_moves()
-        score = -find_move_negamax_alpha_beta(gs, next_moves, depth-1, -beta, -alpha, -turn_multiplier)
+        if moves_searched == 1:
+            score = -find_move_negamax_alpha_beta(gs, None, depth-1, -beta, -alpha, -turn_multiplier, ply+1)
+        else:
+            reduction = 0
+            # evasions are never reduced, at the root either, nor are captures, promotions and checking moves
+            if LATE_MOVE_REDUCTIONS and moves_searched > LMR_FULL_DEPTH_MOVES and depth >= LMR_MIN_DEPTH and \
+                    not in_check and not move.is_capture and not move.pawn_promotion and not gs.is_in_check():
+                reduction = LMR_REDUCTION
+            score = -find_move_negamax_alpha_beta(gs, None, depth-1-reduction, -alpha - NULL_WINDOW, -alpha,
+                                                  -turn_multiplier, ply+1)
+            if score > alpha and reduction != 0 and not search_stopped:
+                score = -find_move_negamax_alpha_beta(gs, None, depth-1, -alpha - NULL_WINDOW, -alpha,
+                                                      -turn_multiplier, ply+1)
+            if alpha < score < beta and not search_stopped:
+                score = -find_move_negamax_alpha_beta(gs, None, depth-1, -beta, -alpha, -turn_multiplier, ply+1)
+        gs.undo_move()
+        if search_stopped:  # the score is meaningless, unwind without storing anything
+            return 0
         if score > max_score:
             max_score = score
-            if depth == DEPTH:
+            best_move_id = move.move_id
+            if ply == 0:
                 next_move = move
                 #print(move, score)
-        gs.undo_move()
         if max_score > alpha:  # pruning happens
             alpha = max_score
         if alpha >= beta:
+            if not move.is_capture and not move.pawn_promotion:
+                update_move_ordering(move, depth, ply)
             break
+
+    if moves_searched == 0:  # no legal move
+        max_score = -CHECKMATE + ply if in_check else STALEMATE
+
+    if max_score <= original_alpha:
+        bound = UPPER_BOUND
+    elif max_score >= beta:
+        bound = LOWER_BOUND
+    else:
+        bound = EXACT
+    transposition_table.store(gs.zobrist_key, depth, score_to_table(max_score, ply), bound, best_move_id)
     return max_score
 
 
+'''
+Mate scores count plies from the root, the transposition table keeps them counted from the stored position so an
+entry is right wherever in the tree the position comes up again
+'''
+
+
+def score_to_table(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score + ply
+    if score <= -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    if score >= MATE_THRESHOLD:
+        return score - ply
+    if score <= -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+'''
+Search only captures and promotions at the leaves so the position is quiet when it gets scored. The side to move
+can stand pat (take the static score) instead of capturing, and captures that can't raise the score to alpha even
+when winning the piece for free are skipped (delta pruning), as are captures that lose material by static exchange
+evaluation. When in check every evasion is searched, and a
+position without any capture is checked for stalemate before standing pat.
+'''
+
+
+def quiescence_search(gs, alpha, beta, turn_multiplier, ply):
+    global nodes
+    nodes += 1
+    if nodes % CHECK_LIMITS_EVERY == 0:
+        check_search_limits()
+
+    if gs.is_in_check():
+        moves = gs.get_valid_moves(move_buffer(ply))
+        if len(moves) == 0:
+            return -CHECKMATE + ply
+        max_score = -CHECKMATE
+        stand_pat = None
+    else:
+        moves = gs.get_capture_moves(move_buffer(ply))
+        if len(moves) == 0 and not gs.has_legal_move():
+            return STALEMATE
+        stand_pat = turn_multiplier * score_board(gs)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        max_score = stand_pat
+
+    for move in order_moves(moves, NO_MOVE, min(ply, MAX_DEPTH)):
+        if stand_pat is not None and not move.pawn_promotion:
+            if stand_pat + pieces_score[move.piece_capture[1]] + DELTA_MARGIN < alpha:
+                continue
+            # a capture that loses material by static exchange evaluation is left out
+            if pieces_score[move.piece_moved[1]] > pieces_score[move.piece_capture[1]] and gs.see(move) < 0:
+                continue
+        gs.make_move(move)
+        score = -quiescence_search(gs, -beta, -alpha, -turn_multiplier, ply+1)
+        gs.undo_move()
+        if search_stopped:
+            return 0
+        if score > max_score:
+            max_score = score
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+    return max_score
+
+
+'''
+Score for the side to move of a position the bitbases have a result for. A bitbase only knows won, drawn or lost,
+not how far the mate is, so a win is BITBASE_WIN plus terms that tell the search which winning moves make progress:
+the material and piece-square score of the winning side (promote the pawn), the losing king's distance from the
+centre and how close the two kings are (drive the king to the edge for the mate).
+'''
+
+
+def bitbase_score(gs, result, turn_multiplier, ply):
+    if result == DRAW:
+        return STALEMATE
+    if result == LOSS and not gs.has_legal_move():
+        return -CHECKMATE + ply
+    winner_multiplier = turn_multiplier if result == WIN else -turn_multiplier
+    loser_king = gs.black_king_location if winner_multiplier == 1 else gs.white_king_location
+    winner_king = gs.white_king_location if winner_multiplier == 1 else gs.black_king_location
+    centre_distance = max(3 - loser_king[0], loser_king[0] - 4) + max(3 - loser_king[1], loser_king[1] - 4)
+    king_distance = abs(loser_king[0] - winner_king[0]) + abs(loser_king[1] - winner_king[1])
+    score = BITBASE_WIN + winner_multiplier * (gs.material_score + gs.position_score * .1) + \
+        (3 * centre_distance + 2 * (14 - king_distance)) * .1
+    return score if result == WIN else -score
+
+
 '''
 A positive score is good for white, a negative score is good for black
 '''
@@ -202,25 +688,8 @@ def score_board(gs):
     elif gs.stalemate:
         return STALEMATE
 
-    score = 0
-    for row in range(len(gs.board)):
-        for col in range(len(gs.board[row])):
-            square = gs.board[row][col]
-            if square != "--":
-                # score it positionally
-                piece_position_score = 0
-                if square[1] != "K":
-                    if square[1] == "p":
-                        piece_position_score = piece_position_scores[square][row][col]
-                    else:
-                        piece_position_score = piece_position_scores[square[1]][row][col]
-
-                if square[0] == "w":
-                    score += pieces_score[square[1]] + piece_position_score * .1
-                elif square[0] == "b":
-                    score -= pieces_score[square[1]] + piece_position_score * .1
-
-    return score
+    # material and positional totals are kept up to date by make_move/undo_move
+    return gs.material_score + gs.position_score * .1
 
 
 '''
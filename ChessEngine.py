@@ -3,10 +3,92 @@ This class is responsible for storing all the information about the current stat
 game. It will be also be responsible for determining the valid move of the current state. It
 will also keep move log.
 """
+import random
+from PieceScores import pieces_score, piece_position_scores
+
+PIECES = ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")
+
+# kinds of moves to generate, combined as bit flags (see GameState.generate_moves for the staged generation)
+CAPTURES = 1  # captures and pawn promotions
+QUIETS = 2  # every other move except castling
+CASTLES = 4
+ALL_MOVES = CAPTURES | QUIETS | CASTLES
+
+# Zobrist keys, one random 64-bit number per piece per square plus side to move, castle rights and en passant file.
+# The generator is seeded so every process (and every run) hashes the same position to the same key.
+zobrist_random = random.Random(20210901)
+ZOBRIST_PIECES = {piece: [[zobrist_random.getrandbits(64) for col in range(8)] for row in range(8)]
+                  for piece in PIECES}
+ZOBRIST_BLACK_TO_MOVE = zobrist_random.getrandbits(64)
+ZOBRIST_CASTLE_RIGHTS = [zobrist_random.getrandbits(64) for i in range(16)]  # indexed by the 4 castle right bits
+ZOBRIST_EN_PASSANT = [zobrist_random.getrandbits(64) for col in range(8)]  # indexed by en passant file
+
+# castle rights are kept in one 4 bit int (GameState.castle_rights)
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+# the rights that survive a move starting or ending on the square: moving the king or a rook, or capturing a rook,
+# loses the rights that piece was part of
+CASTLE_RIGHTS_KEPT = [15] * 64
+CASTLE_RIGHTS_KEPT[7*8 + 4] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLE_RIGHTS_KEPT[7*8 + 7] = 15 & ~WHITE_KINGSIDE
+CASTLE_RIGHTS_KEPT[7*8 + 0] = 15 & ~WHITE_QUEENSIDE
+CASTLE_RIGHTS_KEPT[0*8 + 4] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLE_RIGHTS_KEPT[0*8 + 7] = 15 & ~BLACK_KINGSIDE
+CASTLE_RIGHTS_KEPT[0*8 + 0] = 15 & ~BLACK_QUEENSIDE
+# FEN letter of each castle right with the king and rook squares it needs, in FEN order
+CASTLE_RIGHTS_FEN = (("K", WHITE_KINGSIDE, (7, 4), (7, 7)), ("Q", WHITE_QUEENSIDE, (7, 4), (7, 0)),
+                     ("k", BLACK_KINGSIDE, (0, 4), (0, 7)), ("q", BLACK_QUEENSIDE, (0, 4), (0, 0)))
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+# the undo record stores the en passant square as an index, 64 meaning none
+NO_EN_PASSANT = 64
+EN_PASSANT_SQUARES = [(sq // 8, sq % 8) for sq in range(64)] + [()]
+
+# the piece values and piece-square tables of PieceScores with the sign of the piece's colour (white positive), used
+# to keep the running evaluation sums up to date in make_move/undo_move
+PIECE_MATERIAL = {piece: pieces_score[piece[1]] if piece[0] == "w" else -pieces_score[piece[1]] for piece in PIECES}
+PIECE_POSITION_SCORES = {}
+for piece in PIECES:
+    if piece[1] == "K":
+        PIECE_POSITION_SCORES[piece] = [[0] * 8 for row in range(8)]
+    else:
+        table = piece_position_scores[piece] if piece[1] == "p" else piece_position_scores[piece[1]]
+        sign = 1 if piece[0] == "w" else -1
+        PIECE_POSITION_SCORES[piece] = [[sign * table[row][col] for col in range(8)] for row in range(8)]
+
+# piece values for static exchange evaluation, the king is worth more than anything so it only ever captures last
+SEE_VALUES = dict(pieces_score, K=100)
+
+# Attack tables built once at import, indexed [row][col], so move generation and attack detection don't have to
+# rebuild the offsets and bounds-check every step. The evaluation can use them as well.
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))  # 4 orthogonal, then 4 diagonal
+KNIGHT_OFFSETS = ((-2, -1), (-2, 1), (2, -1), (2, 1), (1, -2), (1, 2), (-1, -2), (-1, 2))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def _targets(offsets):
+    return [[[(r + dr, c + dc) for dr, dc in offsets if 0 <= r + dr < 8 and 0 <= c + dc < 8] for c in range(8)]
+            for r in range(8)]
+
+
+def _ray(r, c, dr, dc):
+    return [(r + dr*i, c + dc*i) for i in range(1, 8) if 0 <= r + dr*i < 8 and 0 <= c + dc*i < 8]
+
+
+KNIGHT_TARGETS = _targets(KNIGHT_OFFSETS)
+KING_TARGETS = _targets(KING_OFFSETS)
+# squares a pawn of the given colour attacks the square from: a white pawn attacks upwards, from the row below
+PAWN_ATTACKERS = {"w": _targets(((1, -1), (1, 1))), "b": _targets(((-1, -1), (-1, 1)))}
+# RAYS[r][c][j] lists the squares going outward from (r, c) in DIRECTIONS[j], nearest first
+RAYS = [[[_ray(r, c, dr, dc) for dr, dc in DIRECTIONS] for c in range(8)] for r in range(8)]
 
 
 class GameState:
-    def __init__(self):
+    '''
+    Starts at the initial position, or at the position of fen if one is given (see load_fen)
+    '''
+    def __init__(self, fen=None):
         # Board is a 8x8 2d list, each element of the list has 2 characters.
         # The first character represents the colour of the piece, 'b' or 'w'.
         # The second character represents type of the piece,'K', 'Q', 'B', 'N', 'R' or 'p'.
@@ -30,24 +112,158 @@ class GameState:
         self.white_king_location = (7, 4)
         self.black_king_location = (0, 4)
         self.in_check = False
-        self.pins = []
+        self.pins = {}  # (row, col) of each pinned piece -> direction from the king to the pinning piece
         self.checks = []
         self.checkmate = False
         self.stalemate = False
         self.en_passant_possible = ()  # coordinates for square where en passant capture is possible
-        self.en_passant_possible_log = [self.en_passant_possible]
-        # Castling rights
-        self.white_castle_kingside = True
-        self.white_castle_Queenside = True
-        self.black_castle_kingside = True
-        self.black_castle_Queenside = True
-        self.castle_rights_log = [CastleRights(self.white_castle_kingside, self.black_castle_kingside,
-                                               self.white_castle_Queenside, self.black_castle_Queenside)]
+        # Castling rights, WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE bits
+        self.castle_rights = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+        # one int per move in move_log with what undo_move can't get back from the move: the Zobrist key, en passant
+        # square and castle rights from before the move, see make_move
+        self.undo_stack = []
+        # Zobrist key of the position, kept up to date by make_move/undo_move
+        self.zobrist_key = self.compute_zobrist_key()
+        # running material and piece-square totals (white positive), kept up to date by make_move/undo_move
+        self.material_score, self.position_score = self.compute_eval_scores()
+        self.piece_count = self.count_pieces()  # kings included, also kept up to date
+        self.non_pawn_material = self.count_non_pawn_material()  # of each colour, also kept up to date
+        # FEN clocks of the position the game started from, the current ones are worked out from the move log
+        self.start_halfmove_clock = 0
+        self.start_fullmove_number = 1
+        if fen is not None:
+            self.load_fen(fen)
+
+    '''
+    Set up the position from a FEN string, e.g. "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1".
+    Missing trailing fields default to "w - - 0 1", an EPD line's 4 fields are enough. Castle rights whose king and
+    rook aren't on their squares are dropped. The move log is cleared, so moves can't be undone past this position.
+    '''
+    def load_fen(self, fen):
+        fields = fen.split()
+        if len(fields) > 1 and fields[1] not in ("w", "b"):
+            raise ValueError("Invalid FEN, side to move must be w or b: " + fen)
+        rows = fields[0].split("/") if fields else []
+        if len(rows) != 8:
+            raise ValueError("Invalid FEN, expected 8 rows: " + fen)
+        board = []
+        for row in rows:
+            board_row = []
+            for char in row:
+                if char.isdigit():
+                    board_row.extend(["--"] * int(char))
+                elif char in "pnbrqkPNBRQK":
+                    color = "w" if char.isupper() else "b"
+                    board_row.append(color + (char.lower() if char in "pP" else char.upper()))
+                else:
+                    raise ValueError("Invalid FEN, unknown piece " + char + ": " + fen)
+            if len(board_row) != 8:
+                raise ValueError("Invalid FEN, expected 8 squares per row: " + fen)
+            board.append(board_row)
+        kings = [(r, c) for r in range(8) for c in range(8) if board[r][c] == "wK"], \
+            [(r, c) for r in range(8) for c in range(8) if board[r][c] == "bK"]
+        if len(kings[0]) != 1 or len(kings[1]) != 1:
+            raise ValueError("Invalid FEN, expected one king of each colour: " + fen)
+        if "p" in (board[0][c][1] for c in range(8)) or "p" in (board[7][c][1] for c in range(8)):
+            raise ValueError("Invalid FEN, pawn on the first or eighth rank: " + fen)
+        white_to_move = len(fields) < 2 or fields[1] == "w"
+        en_passant = ()
+        if len(fields) > 3 and fields[3] != "-":
+            # the square a pawn of the side that just moved skipped: that pawn is in front of it, and the square
+            # and the one the pawn came from are empty
+            ep_rank, pawn, forward = ("6", "bp", 1) if white_to_move else ("3", "wp", -1)
+            if len(fields[3]) != 2 or fields[3][0] not in Move.files_to_cols or fields[3][1] != ep_rank:
+                raise ValueError("Invalid FEN, bad en passant square " + fields[3] + ": " + fen)
+            r, c = Move.rank_to_rows[fields[3][1]], Move.files_to_cols[fields[3][0]]
+            if board[r + forward][c] != pawn or board[r][c] != "--" or board[r - forward][c] != "--":
+                raise ValueError("Invalid FEN, no pawn passed en passant square " + fields[3] + ": " + fen)
+            en_passant = (r, c)
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = max(int(fields[5]), 1) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("Invalid FEN, clocks must be numbers: " + fen)
+
+        # valid, nothing is changed before this point
+        self.board = board
+        self.white_king_location, self.black_king_location = kings[0][0], kings[1][0]
+        self.white_to_move = white_to_move
+        castle_rights = fields[2] if len(fields) > 2 else "-"
+        self.castle_rights = 0
+        for char, right, (king_row, king_col), (rook_row, rook_col) in CASTLE_RIGHTS_FEN:
+            color = "w" if char.isupper() else "b"
+            if char in castle_rights and board[king_row][king_col] == color + "K" and \
+                    board[rook_row][rook_col] == color + "R":
+                self.castle_rights |= right
+        self.en_passant_possible = en_passant
+        self.start_halfmove_clock = halfmove_clock
+        self.start_fullmove_number = fullmove_number
+
+        self.move_log = []
+        self.in_check = False
+        self.pins = {}  # (row, col) of each pinned piece -> direction from the king to the pinning piece
+        self.checks = []
+        self.checkmate = False
+        self.stalemate = False
+        self.undo_stack = []
+        self.zobrist_key = self.compute_zobrist_key()
+        self.material_score, self.position_score = self.compute_eval_scores()
+        self.piece_count = self.count_pieces()
+        self.non_pawn_material = self.count_non_pawn_material()
+
+    '''
+    FEN string of the current position
+    '''
+    def get_fen(self):
+        rows = []
+        for row in self.board:
+            text = ""
+            empty = 0
+            for piece in row:
+                if piece == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += piece[1].upper() if piece[0] == "w" else piece[1].lower()
+            rows.append(text + (str(empty) if empty else ""))
+        castle_rights = "".join(char for char, right, king_sq, rook_sq in CASTLE_RIGHTS_FEN
+                                if self.castle_rights & right) or "-"
+        en_passant = Move.cols_to_files[self.en_passant_possible[1]] + \
+            Move.rows_to_ranks[self.en_passant_possible[0]] if self.en_passant_possible != () else "-"
+        return " ".join(("/".join(rows), "w" if self.white_to_move else "b", castle_rights, en_passant,
+                         str(self.get_halfmove_clock()), str(self.get_fullmove_number())))
+
+    '''
+    Plies since the last capture or pawn move (the fifty move rule counter). Counted back through the move log when
+    asked for, so make_move doesn't have to keep it.
+    '''
+    def get_halfmove_clock(self):
+        clock = 0
+        for move in reversed(self.move_log):
+            if move.piece_moved[1] == "p" or move.is_capture:
+                return clock
+            clock += 1
+        return clock + self.start_halfmove_clock
+
+    '''
+    Number of the current full move, it goes up after each black move
+    '''
+    def get_fullmove_number(self):
+        # the side that moved first is the side to move now if an even number of moves were made
+        black_started = self.white_to_move == (len(self.move_log) % 2 == 1)
+        return self.start_fullmove_number + (len(self.move_log) + black_started) // 2
 
     '''
     Takes a moves as a parameter and executes it.(this will not work for castling, pawn-promotion, en-passant)
     '''
     def make_move(self, move):
+        old_en_passant = self.en_passant_possible
+        old_castle_rights = self.castle_rights
+        # undo record: Zobrist key << 11 | en passant square index << 4 | castle rights
+        en_passant_index = old_en_passant[0]*8 + old_en_passant[1] if old_en_passant != () else NO_EN_PASSANT
+        self.undo_stack.append(self.zobrist_key << 11 | en_passant_index << 4 | old_castle_rights)
         self.board[move.start_row][move.start_col] = "--"
         self.board[move.end_row][move.end_col] = move.piece_moved
         self.move_log.append(move)  # log the move so we can undo it later
@@ -69,13 +285,10 @@ class GameState:
 
         # pawn promotion
         if move.pawn_promotion:
-            # promoted_piece = input("Promote to Q, R, B, N: ")  # we can make this part of the ui later
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + "Q"
+            self.board[move.end_row][move.end_col] = move.piece_moved[0] + move.promotion_piece
 
         # update castling rights
         self.update_castle_rights(move)
-        self.castle_rights_log.append(CastleRights(self.white_castle_kingside, self.black_castle_kingside,
-                                                   self.white_castle_Queenside, self.black_castle_Queenside))
         # castle moves
         if move.castle:
             if move.end_col - move.start_col == 2:  # kingside
@@ -85,13 +298,14 @@ class GameState:
                 self.board[move.end_row][move.end_col+1] = self.board[move.end_row][move.end_col-2]  # move rook
                 self.board[move.end_row][move.end_col-2] = "--"  # empty space where rook was
 
-        self.en_passant_possible_log.append(self.en_passant_possible)
+        self.update_zobrist_key(move, old_en_passant, old_castle_rights)
+        self.update_eval_scores(move, 1)
 
     '''
     Undo the last move made
     '''
     def undo_move(self):
-        if self.move_log != 0:  # make sure there is a move to undo.
+        if len(self.move_log) != 0:  # make sure there is a move to undo.
             move = self.move_log.pop()
             self.board[move.start_row][move.start_col] = move.piece_moved
             self.board[move.end_row][move.end_col] = move.piece_capture
@@ -106,16 +320,12 @@ class GameState:
                 self.board[move.end_row][move.end_col] = "--"  # move that pawn that was added in the square
                 self.board[move.start_row][move.end_col] = move.piece_capture  # puts the pawn on the correct square it was captured from
 
-            self.en_passant_possible_log.pop()
-            self.en_passant_possible = self.en_passant_possible_log[-1]
-
-            # give back castle rights if move took them away
-            self.castle_rights_log.pop()  # remove the last moves updates
-            castle_rights = self.castle_rights_log[-1]
-            self.white_castle_kingside = castle_rights.wks
-            self.black_castle_kingside = castle_rights.bks
-            self.white_castle_Queenside = castle_rights.wqs
-            self.black_castle_Queenside = castle_rights.bqs
+            # en passant square, Zobrist key and castle rights from before the move
+            undo_record = self.undo_stack.pop()
+            self.castle_rights = undo_record & 15
+            self.en_passant_possible = EN_PASSANT_SQUARES[(undo_record >> 4) & 127]
+            self.zobrist_key = undo_record >> 11
+            self.update_eval_scores(move, -1)
 
             # undo castle
             if move.castle:
@@ -131,10 +341,38 @@ class GameState:
             self.stalemate = False
 
     '''
-    All moves considering checks
+    Pass the turn without moving a piece (null move pruning in the search). Only the side to move, the en passant
+    square and the Zobrist key change. Must be taken back with undo_null_move before any other move is undone.
+    '''
+    def make_null_move(self):
+        en_passant_index = NO_EN_PASSANT
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE
+        if self.en_passant_possible != ():
+            en_passant_index = self.en_passant_possible[0]*8 + self.en_passant_possible[1]
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_possible[1]]
+        self.undo_stack.append(self.zobrist_key << 11 | en_passant_index << 4 | self.castle_rights)
+        self.zobrist_key = key
+        self.en_passant_possible = ()
+        self.white_to_move = not self.white_to_move
+
+    def undo_null_move(self):
+        undo_record = self.undo_stack.pop()
+        self.en_passant_possible = EN_PASSANT_SQUARES[(undo_record >> 4) & 127]
+        self.zobrist_key = undo_record >> 11
+        self.white_to_move = not self.white_to_move
+
+    '''
+    True if the side to move has a piece other than its king and pawns. Without one zugzwang is likely and passing
+    can't be used to prove a cutoff.
     '''
-    def get_valid_moves(self):
-        moves = []
+    def has_non_pawn_material(self):
+        return self.non_pawn_material["w" if self.white_to_move else "b"] != 0
+
+    '''
+    All moves considering checks. The moves are put in the moves list when one is given, so the search can reuse one
+    list per ply instead of allocating a new one for every node.
+    '''
+    def get_valid_moves(self, moves=None):
         self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
         if self.white_to_move:
             king_row = self.white_king_location[0]
@@ -144,32 +382,9 @@ class GameState:
             king_col = self.black_king_location[1]
 
         if self.in_check:
-            if len(self.checks) == 1:  # only 1 check, block check or move king
-                moves = self.get_all_possible_moves()
-                # To block a check you must move a piece into one of the squares between enemy piece and king
-                check = self.checks[0]
-                check_row = check[0]
-                check_col = check[1]
-                piece_checking = self.board[check_row][check_col]  # Enemy piece causing the check
-                valid_squares = []  # valid squares move to
-                # if knight , we must capture knight or move king
-                if piece_checking[1] == "N":
-                    valid_squares = [(check_row, check_col)]
-                else:
-                    for i in range(1, 8):
-                        valid_square = (king_row + check[2]*i, king_col + check[3]*i)  # check[2] and check[3] are check directions
-                        valid_squares.append(valid_square)
-                        if valid_square[0] == check_row and valid_square[1] == check_col:  # once you get to piece end checks
-                            break
-                # get rid of any moves that don't block check or move king
-                for i in range(len(moves)-1, -1, -1):  # go through backwards when removing from a list as iterating
-                    if moves[i].piece_moved[1] != "K":  # doesn't move king so it must block or capture
-                        if not (moves[i].end_row, moves[i].end_col) in valid_squares:  # move doesn't block or check a piece
-                            moves.remove(moves[i])
-            else:  # double check king has to move
-                self.get_king_moves(king_row, king_col, moves)
+            moves = self.get_evasion_moves(king_row, king_col, moves)
         else:  # not in check so all moves are fine
-            moves = self.get_all_possible_moves()
+            moves = self.get_all_possible_moves(ALL_MOVES, moves)
 
         if len(moves) == 0:
             if self.in_check:
@@ -183,31 +398,276 @@ class GameState:
         return moves
 
     '''
-    All moves without considering checks
+    The moves out of check: king moves, and with a single check the moves that capture the checking piece or block
+    its line. Instead of generating every move and throwing most of them away, the pieces that can reach the
+    capture and block squares are looked up from those squares with the attack tables. A pinned piece never helps
+    (it can only move along the pin, which doesn't cross the check), so pinned pieces are skipped.
+    '''
+    def get_evasion_moves(self, king_row, king_col, moves=None):
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
+        self.get_king_moves(king_row, king_col, moves, CAPTURES | QUIETS)
+        if len(self.checks) != 1:  # double check king has to move
+            return moves
+
+        check_row, check_col, check_row_direction, check_col_direction = self.checks[0]
+        piece_checking = self.board[check_row][check_col]  # Enemy piece causing the check
+        pinned = self.pins
+        # capture the checking piece, or for a slider also move between it and the king
+        self.add_moves_to_square(check_row, check_col, moves, pinned)
+        if piece_checking[1] in ("R", "B", "Q"):
+            for i in range(1, 8):
+                block_row, block_col = king_row + check_row_direction*i, king_col + check_col_direction*i
+                if block_row == check_row and block_col == check_col:
+                    break
+                self.add_moves_to_square(block_row, block_col, moves, pinned)
+        # en passant can still capture a pawn that gives check
+        if piece_checking[1] == "p" and self.en_passant_possible != () and \
+                self.en_passant_possible[1] == check_col and \
+                self.en_passant_possible[0] == check_row + (-1 if self.white_to_move else 1):
+            self.add_en_passant_moves(self.en_passant_possible[0], check_col, moves, pinned)
+        return moves
+
+    '''
+    Add the moves of the unpinned pieces (not the king) of the side to move that can go to square (r, c)
+    '''
+    def add_moves_to_square(self, r, c, moves, pinned):
+        board = self.board
+        ally_color = "w" if self.white_to_move else "b"
+        end_sq = (r, c)
+        capture = board[r][c] != "--"
+        knight = ally_color + "N"
+        for start in KNIGHT_TARGETS[r][c]:
+            if board[start[0]][start[1]] == knight and start not in pinned:
+                moves.append(Move(start, end_sq, board))
+        # a slider reaches the square if it is the first piece on a ray from the square
+        queen = ally_color + "Q"
+        rays = RAYS[r][c]
+        for j in range(8):
+            slider = ally_color + ("R" if j < 4 else "B")  # orthogonal rays first, then diagonal ones
+            for start in rays[j]:
+                piece = board[start[0]][start[1]]
+                if piece != "--":
+                    if (piece == slider or piece == queen) and start not in pinned:
+                        moves.append(Move(start, end_sq, board))
+                    break
+        pawn = ally_color + "p"
+        if capture:
+            for start in PAWN_ATTACKERS[ally_color][r][c]:
+                if board[start[0]][start[1]] == pawn and start not in pinned:
+                    self.add_pawn_move(start, end_sq, moves)
+        else:
+            move_amount = -1 if self.white_to_move else 1
+            start_row = r - move_amount
+            if 0 <= start_row < 8:
+                if board[start_row][c] == pawn:
+                    if (start_row, c) not in pinned:
+                        self.add_pawn_move((start_row, c), end_sq, moves)
+                elif board[start_row][c] == "--" and start_row == (5 if self.white_to_move else 2) and \
+                        board[start_row - move_amount][c] == pawn and (start_row - move_amount, c) not in pinned:
+                    moves.append(Move((start_row - move_amount, c), end_sq, board))  # 2 square move
+            if end_sq == self.en_passant_possible:  # an en passant capture can block the check
+                self.add_en_passant_moves(r, c, moves, pinned)
+
+    '''
+    Add the en passant captures onto square (r, c), get_pawn_moves checks that they don't expose the king
+    '''
+    def add_en_passant_moves(self, r, c, moves, pinned):
+        pawn = ("w" if self.white_to_move else "b") + "p"
+        for start in PAWN_ATTACKERS[pawn[0]][r][c]:
+            if self.board[start[0]][start[1]] == pawn and start not in pinned:
+                pawn_moves = []
+                self.get_pawn_moves(start[0], start[1], pawn_moves, CAPTURES)
+                for move in pawn_moves:
+                    if move.en_passant:
+                        moves.append(move)
+
+    '''
+    Legal captures and pawn promotions only, used by the quiescence search
+    '''
+    def get_capture_moves(self, moves=None):
+        return self.get_stage_moves(CAPTURES, moves)
+
+    '''
+    The legal moves of the kinds in gen_type (CAPTURES, QUIETS, CASTLES or a combination). It doesn't build the full
+    move list unless the king is in check.
+    '''
+    def get_stage_moves(self, gen_type, moves=None):
+        self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
+        if self.in_check or gen_type == ALL_MOVES:
+            moves = self.get_valid_moves(moves)
+            if gen_type != ALL_MOVES:
+                moves[:] = [move for move in moves if move.gen_type() & gen_type]
+            return moves
+        if gen_type == CASTLES:  # no need to go over the other pieces
+            if moves is None:
+                moves = []
+            else:
+                moves.clear()
+            king_row, king_col = self.white_king_location if self.white_to_move else self.black_king_location
+            self.get_castle_moves(king_row, king_col, moves, "w" if self.white_to_move else "b")
+            return moves
+        return self.get_all_possible_moves(gen_type, moves)
+
+    '''
+    Legal moves produced lazily in stages: the hash move, then captures and promotions, then quiet moves, then
+    castling. A stage is only generated once the moves before it have all been taken, so a search that stops after
+    a cutoff skips the rest of the work. The moves of each stage are sorted by sort_key, highest first, when it is
+    given. Sets self.in_check right away; in check all the evasions are generated at once.
+    '''
+    def generate_moves(self, hash_move_id=0, sort_key=None, moves=None):
+        self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
+        return self.generate_move_stages(hash_move_id, sort_key, moves, self.in_check)
+
+    def generate_move_stages(self, hash_move_id, sort_key, moves, in_check):
+        if in_check:
+            stages = (ALL_MOVES,)
+            hash_move = None
+        else:
+            stages = (CAPTURES, QUIETS, CASTLES)
+            hash_move = self.legal_hash_move(hash_move_id) if hash_move_id else None
+            if hash_move is not None:
+                yield hash_move
+        for gen_type in stages:
+            moves = self.get_stage_moves(gen_type, moves)
+            if sort_key is not None:
+                moves.sort(key=sort_key, reverse=True)
+            if gen_type == ALL_MOVES:  # the hash move still goes first
+                for move in moves:
+                    if move.move_id == hash_move_id:
+                        hash_move = move
+                        yield move
+            for move in moves:
+                if hash_move is None or move.move_id != hash_move_id:
+                    yield move
+
+    '''
+    The move with the given id if it is legal in this position, otherwise None (a transposition table entry can
+    be a different position with the same hash). Only the moves of the piece on its start square are generated.
+    Needs self.pins of the position and the king not in check.
     '''
-    def get_all_possible_moves(self):
-        moves = []
+    def legal_hash_move(self, move_id):
+        r, c = divmod(move_id & 63, 8)
+        piece = self.board[r][c]
+        if piece[0] != ("w" if self.white_to_move else "b"):
+            return None
+        candidates = []
+        self.move_function[piece[1]](r, c, candidates, ALL_MOVES)
+        for move in candidates:
+            if move.move_id == move_id:
+                return move
+        return None
+
+    '''
+    True if the side to move has a legal move. Stops at the first piece that can move instead of building the whole
+    list, so checkmate and stalemate can be told apart cheaply.
+    '''
+    def has_legal_move(self):
+        self.in_check, self.pins, self.checks = self.check_for_pins_and_checks()
+        if self.in_check:
+            return len(self.get_valid_moves()) != 0
+        # castling is left out, if it is legal so is the king's step towards the rook
+        return len(self.get_all_possible_moves(CAPTURES | QUIETS, first_only=True)) != 0
+
+    '''
+    True if the king of the side to move is attacked, without building the pins and checks lists
+    '''
+    def is_in_check(self):
+        if self.white_to_move:
+            return self.square_under_attack(self.white_king_location[0], self.white_king_location[1], "w")
+        return self.square_under_attack(self.black_king_location[0], self.black_king_location[1], "b")
+
+    '''
+    Static exchange evaluation of a capture: the material it wins (in pieces_score units, negative if it loses) once
+    both sides have recaptured on the target square, always with their least valuable piece and free to stop when
+    going on would lose more. Sliders lined up behind another attacker (x-rays) join in once the piece in front has
+    captured. Pins are not looked at.
+    '''
+    def see(self, move):
+        board = self.board
+        r, c = move.end_row, move.end_col
+        start = (move.start_row, move.start_col)  # the moving piece has already left its square
+        # so has a pawn taken en passant, which isn't on the target square
+        en_passant_square = (move.start_row, move.end_col) if move.en_passant else start
+        attackers = {"w": [], "b": []}  # (value, ray index) of the pieces that can capture now, -1 for a knight
+        lines = []  # per ray, the attackers waiting behind the one in front, farthest first
+        for j, ray in enumerate(RAYS[r][c]):
+            line = []
+            slider = "R" if j < 4 else "B"
+            for row, col in ray:
+                piece = board[row][col]
+                if piece == "--" or (row, col) == start or (row, col) == en_passant_square:
+                    continue
+                kind = piece[1]
+                if kind == "Q" or kind == slider or not line and (
+                        kind == "K" and (row, col) in KING_TARGETS[r][c] or
+                        kind == "p" and (row, col) in PAWN_ATTACKERS[piece[0]][r][c]):
+                    line.append(piece)
+                else:
+                    break
+            line.reverse()
+            if line:
+                piece = line.pop()
+                attackers[piece[0]].append((SEE_VALUES[piece[1]], j))
+            lines.append(line)
+        for row, col in KNIGHT_TARGETS[r][c]:
+            piece = board[row][col]
+            if piece[1] == "N" and (row, col) != start:
+                attackers[piece[0]].append((SEE_VALUES["N"], -1))
+
+        # gains[i] is what the side making capture i wins if the exchange stops after it
+        gains = [SEE_VALUES[move.piece_capture[1]] if move.piece_capture != "--" else 0]
+        if move.pawn_promotion:
+            gains[0] += SEE_VALUES[move.promotion_piece] - SEE_VALUES["p"]
+            on_square = SEE_VALUES[move.promotion_piece]
+        else:
+            on_square = SEE_VALUES[move.piece_moved[1]]
+        color = "b" if move.piece_moved[0] == "w" else "w"
+        while attackers[color]:
+            attacker = min(attackers[color])
+            attackers[color].remove(attacker)
+            line = lines[attacker[1]] if attacker[1] >= 0 else None
+            if line:
+                piece = line.pop()
+                attackers[piece[0]].append((SEE_VALUES[piece[1]], attacker[1]))
+            gains.append(on_square - gains[-1])
+            on_square = attacker[0]
+            color = "b" if color == "w" else "w"
+        # each side only recaptures when that is better than stopping
+        while len(gains) > 1:
+            gain = gains.pop()
+            gains[-1] = -max(-gains[-1], gain)
+        return gains[0]
+
+    '''
+    All moves without considering checks, put in moves when it is given. With first_only it returns as soon as one
+    piece has a move.
+    '''
+    def get_all_possible_moves(self, gen_type=ALL_MOVES, moves=None, first_only=False):
+        if moves is None:
+            moves = []
+        else:
+            moves.clear()
 
         for r in range(len(self.board)):
             for c in range(len(self.board[r])):
                 turn = self.board[r][c][0]
                 if (turn == "w" and self.white_to_move) or (turn == "b" and not self.white_to_move):
                     piece = self.board[r][c][1]
-                    self.move_function[piece](r, c, moves)  # calls the appropriate move function based on piece type.
+                    # calls the appropriate move function based on piece type.
+                    self.move_function[piece](r, c, moves, gen_type)
+                    if first_only and moves:
+                        return moves
         return moves
 
     '''
     Get all the pawn moves for the pawn located at row, col and add these moves to the list
     '''
-    def get_pawn_moves(self, r, c, moves):
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins)-1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
+    def get_pawn_moves(self, r, c, moves, gen_type=ALL_MOVES):
+        pin_direction = self.pins.get((r, c))
+        piece_pinned = pin_direction is not None
 
         if self.white_to_move:
             move_amount = -1
@@ -222,17 +682,20 @@ class GameState:
             enemy_color = "w"
             king_row, king_col = self.black_king_location
 
-        if self.board[r+move_amount][c] == "--":  # 1 sq pawn advance
-            if not piece_pinned or pin_direction == (move_amount, 0):
-                moves.append(Move((r, c), (r+move_amount, c), self.board))
+        if self.board[r+move_amount][c] == "--":  # 1 sq pawn advance, a pawn pinned along its file can still push
+            if (not piece_pinned or pin_direction[1] == 0) and \
+                    gen_type & (CAPTURES if r+move_amount == back_row else QUIETS):  # promotions count as captures
+                self.add_pawn_move((r, c), (r+move_amount, c), moves)
                 if r == start_row and self.board[r+2*move_amount][c] == "--":  # 2 square move
                     moves.append(Move((r, c), (r+2*move_amount, c), self.board))
 
+        if not gen_type & CAPTURES:
+            return
         # captures
         if c-1 >= 0:  # captures to left
             if not piece_pinned or pin_direction == (move_amount, -1):
                 if self.board[r+move_amount][c-1][0] == enemy_color:  # enemy piece to capture
-                    moves.append(Move((r, c), (r+move_amount, c-1), self.board))
+                    self.add_pawn_move((r, c), (r+move_amount, c-1), moves)
                 if (r + move_amount, c-1) == self.en_passant_possible:
                     attacking_piece = blocking_piece = False
                     if king_row == r:
@@ -250,14 +713,16 @@ class GameState:
                             square = self.board[r][i]
                             if square[0] == enemy_color and (square[1] == "R" or square[1] == "Q"):  # attacking piece
                                 attacking_piece = True
+                                break
                             elif square != "--":
                                 blocking_piece = True
+                                break
                     if not attacking_piece or blocking_piece:
                         moves.append(Move((r, c), (r+move_amount, c-1), self.board, en_passant=True))
         if c+1 <= 7:  # captures to right
             if not piece_pinned or pin_direction == (move_amount, 1):
                 if self.board[r + move_amount][c + 1][0] == enemy_color:  # enemy piece to capture
-                    moves.append(Move((r, c), (r + move_amount, c+1), self.board))
+                    self.add_pawn_move((r, c), (r + move_amount, c+1), moves)
                 if (r + move_amount, c+1) == self.en_passant_possible:
                     attacking_piece = blocking_piece = False
                     if king_row == r:
@@ -275,137 +740,97 @@ class GameState:
                             square = self.board[r][i]
                             if square[0] == enemy_color and (square[1] == "R" or square[1] == "Q"):  # attacking piece
                                 attacking_piece = True
+                                break
                             elif square != "--":
                                 blocking_piece = True
+                                break
                     if not attacking_piece or blocking_piece:
-                        moves.append(Move((r, c), (r + move_amount, c - 1), self.board, en_passant=True))
+                        moves.append(Move((r, c), (r + move_amount, c + 1), self.board, en_passant=True))
 
     '''
-    Get all the rook moves for the rook located at row, col and add these moves to the list
+    Add a pawn move to the list, a move to the back row is added once for every piece the pawn can promote to
     '''
-    def get_rook_moves(self, r, c, moves):
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                if self.board[r][c][1] != "Q":  # can't remove queen from pin on rook moves, only remove it on bishop moves
-                    self.pins.remove(self.pins[i])
-                break
-
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))
-        enemy_color = "b" if self.white_to_move else "w"
+    def add_pawn_move(self, start_sq, end_sq, moves):
+        if end_sq[0] == 0 or end_sq[0] == 7:
+            for promotion_piece in Move.promotion_pieces:
+                moves.append(Move(start_sq, end_sq, self.board, promotion_piece=promotion_piece))
+        else:
+            moves.append(Move(start_sq, end_sq, self.board))
 
-        for d in directions:
-            for i in range(1, 8):
-                end_row = r + d[0]*i
-                end_col = c + d[1]*i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:  # on the board
-                    if not piece_pinned or pin_direction == d or pin_direction == (-d[0], -d[1]):
-                        end_piece = self.board[end_row][end_col]
-                        if end_piece == "--":  # empty space valid
-                            moves.append(Move((r, c), (end_row, end_col), self.board))
-                        elif end_piece[0] == enemy_color:  # enemy piece capture
-                            moves.append(Move((r, c), (end_row, end_col), self.board))
-                            break
-                        else:  # friendly piece
-                            break
-                else:  # off board
-                    break
+    '''
+    Get all the rook moves for the rook located at row, col and add these moves to the list
+    '''
+    def get_rook_moves(self, r, c, moves, gen_type=ALL_MOVES):
+        self.get_slider_moves(r, c, moves, gen_type, 0)
 
     '''
     Get all the knight moves for the knight located at row, col and add these moves to the list
     '''
-    def get_knight_moves(self, r, c, moves):
-        piece_pinned = False
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                self.pins.remove(self.pins[i])
-                break
-
-        knight_moves = ((-2, -1), (-2, 1), (2, -1), (2, 1), (1, -2), (1, 2), (-1, -2), (-1, 2))
+    def get_knight_moves(self, r, c, moves, gen_type=ALL_MOVES):
+        if (r, c) in self.pins:  # a pinned knight can never move
+            return
+        board = self.board
         ally_color = "w" if self.white_to_move else "b"
-
-        for m in knight_moves:
-            end_row = r + m[0]
-            end_col = c + m[1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:  # on the board
-                if not piece_pinned:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] != ally_color:  # not an ally piece (empty or enemy piece)
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
+        for end_sq in KNIGHT_TARGETS[r][c]:
+            end_piece = board[end_sq[0]][end_sq[1]]
+            if end_piece[0] != ally_color:  # not an ally piece (empty or enemy piece)
+                if gen_type & (QUIETS if end_piece == "--" else CAPTURES):
+                    moves.append(Move((r, c), end_sq, board))
 
     '''
     Get all the bishop moves for the bishop located at row, col and add these moves to the list
     '''
-    def get_bishop_moves(self, r, c, moves):
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-
-        directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))  # 4 diagonals
-        enemy_color = "b" if self.white_to_move else "w"
+    def get_bishop_moves(self, r, c, moves, gen_type=ALL_MOVES):
+        self.get_slider_moves(r, c, moves, gen_type, 4)
 
-        for d in directions:
-            for i in range(1, 8):
-                end_row = r + d[0]*i
-                end_col = c + d[1]*i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:  # on the board
-                    if not piece_pinned or pin_direction == d or pin_direction == (-d[0], -d[1]):
-                        end_piece = self.board[end_row][end_col]
-                        if end_piece == "--":  # empty space valid
-                            moves.append(Move((r, c), (end_row, end_col), self.board))
-                        elif end_piece[0] == enemy_color:  # enemy piece capture
-                            moves.append(Move((r, c), (end_row, end_col), self.board))
-                            break
-                        else:  # friendly piece
-                            break
-                else:  # off board
+    '''
+    Moves along the rays DIRECTIONS[first_direction:first_direction + 4], the orthogonal ones for rooks (0) and the
+    diagonal ones for bishops (4). A pinned piece only moves along the pin.
+    '''
+    def get_slider_moves(self, r, c, moves, gen_type, first_direction):
+        pin_direction = self.pins.get((r, c))
+        board = self.board
+        enemy_color = "b" if self.white_to_move else "w"
+        quiets = gen_type & QUIETS
+        captures = gen_type & CAPTURES
+        rays = RAYS[r][c]
+        for j in range(first_direction, first_direction + 4):
+            d = DIRECTIONS[j]
+            if pin_direction is not None and pin_direction != d and pin_direction != (-d[0], -d[1]):
+                continue
+            for end_sq in rays[j]:
+                end_piece = board[end_sq[0]][end_sq[1]]
+                if end_piece == "--":  # empty space valid
+                    if quiets:
+                        moves.append(Move((r, c), end_sq, board))
+                elif end_piece[0] == enemy_color:  # enemy piece capture
+                    if captures:
+                        moves.append(Move((r, c), end_sq, board))
+                    break
+                else:  # friendly piece
                     break
 
     '''
     Get all the queen moves for the queen located at row, col and add these moves to the list
     '''
-    def get_queen_moves(self, r, c, moves):
-        self.get_rook_moves(r, c, moves)
-        self.get_bishop_moves(r, c, moves)
+    def get_queen_moves(self, r, c, moves, gen_type=ALL_MOVES):
+        self.get_rook_moves(r, c, moves, gen_type)
+        self.get_bishop_moves(r, c, moves, gen_type)
 
     '''
     Get all the king moves for the king located at row, col and add these moves to the list
     '''
-    def get_king_moves(self, r, c, moves):
-        row_moves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        col_moves = (-1, 0, 1, -1, 1, -1, 0, 1)
+    def get_king_moves(self, r, c, moves, gen_type=ALL_MOVES):
+        board = self.board
         ally_color = "w" if self.white_to_move else "b"
-
-        for i in range(8):
-            end_row = r + row_moves[i]
-            end_col = c + col_moves[i]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:  # on the board
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:  # not an ally piece (empty or enemy piece)
-                    # place king on end square and check for checks
-                    if ally_color == "w":
-                        self.white_king_location = (end_row, end_col)
-                    else:
-                        self.black_king_location = (end_row, end_col)
-
-                    in_check, pins, check = self.check_for_pins_and_checks()
-                    if not in_check:
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                    # place king back on original position
-                    if ally_color == "w":
-                        self.white_king_location = (r, c)
-                    else:
-                        self.black_king_location = (r, c)
-        self.get_castle_moves(r, c, moves, ally_color)
+        for end_sq in KING_TARGETS[r][c]:
+            end_piece = board[end_sq[0]][end_sq[1]]
+            if end_piece[0] != ally_color and gen_type & (QUIETS if end_piece == "--" else CAPTURES):
+                # the king's own square counts as empty so it doesn't hide the squares behind it from a slider
+                if not self.square_under_attack(end_sq[0], end_sq[1], ally_color, (r, c)):
+                    moves.append(Move((r, c), end_sq, board))
+        if gen_type & CASTLES:
+            self.get_castle_moves(r, c, moves, ally_color)
 
     '''
     Generate castle moves for king at (r, c) and add them  to the list of moves
@@ -415,10 +840,10 @@ class GameState:
         if in_check:
             # print("oof")
             return  # can't castle in check
-        if(self.white_to_move and self.white_castle_kingside) or (not self.white_to_move and self.black_castle_kingside):
+        if self.castle_rights & (WHITE_KINGSIDE if self.white_to_move else BLACK_KINGSIDE):
             # can't castle if given up rights
             self.get_kingside_castle_moves(r, c, moves, ally_color)
-        if (self.white_to_move and self.white_castle_Queenside) or (not self.white_to_move and self.black_castle_Queenside):
+        if self.castle_rights & (WHITE_QUEENSIDE if self.white_to_move else BLACK_QUEENSIDE):
             self.get_Queenside_castle_moves(r, c, moves, ally_color)
 
     '''
@@ -442,56 +867,40 @@ class GameState:
             moves.append(Move((r, c), (r, c-2), self.board, castle=True))
 
     '''
-    determine if the enemy can attack the square r, c
+    determine if the enemy can attack the square r, c. A piece on empty_sq is looked through as if it had moved away.
     '''
-    def square_under_attack(self, r, c, ally_color):
-        # check outward from square
+    def square_under_attack(self, r, c, ally_color, empty_sq=None):
+        board = self.board
         enemy_color = "w" if ally_color == "b" else "b"
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            d = directions[j]
-            for i in range(1, 8):
-                end_row = r + d[0]*i
-                end_col = c + d[1]*i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] == ally_color:  # no attack from that direction
-                        break
-                    elif end_piece[0] == enemy_color:
-                        type = end_piece[1]
-                        # 5 possibilities in this complex conditional
-                        # 1. orthogonally away from square and piece is a rook
-                        # 2. diagonally away from square and piece is a bishop
-                        # 3. 1 square diagonally away from square and piece is a pawn
-                        # 4. any direction and piece is a queen
-                        # 5. any direction 1 square away and piece is a king
-                        if (0 <= j <= 3 and type == "R") or \
-                                (4 <= j <= 7 and type == "B") or \
-                                (i == 1 and type == "p" and (
-                                    (enemy_color == "w" and 6 <= j <= 7) or (enemy_color == "b" and 4 <= j <= 5))) or \
-                                (type == "Q") or (i == 1 and type == "K"):
-                            return True
-                        else:  # enemy piece not applying check
-                            break
-                else:
-                    break  # off the board
-        # check for knight checks
-        knight_moves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        for m in knight_moves:
-            end_row = r + m[0]
-            end_col = c + m[1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] == enemy_color and end_piece[1] == "N":  # enemy knight attacking king
-                    return True
-
+        enemy_knight, enemy_pawn, enemy_king = enemy_color + "N", enemy_color + "p", enemy_color + "K"
+        for end_row, end_col in KNIGHT_TARGETS[r][c]:
+            if board[end_row][end_col] == enemy_knight:
+                return True
+        for end_row, end_col in PAWN_ATTACKERS[enemy_color][r][c]:
+            if board[end_row][end_col] == enemy_pawn:
+                return True
+        for end_row, end_col in KING_TARGETS[r][c]:
+            if board[end_row][end_col] == enemy_king:
+                return True
+        # check outward from square, the first piece on each ray is the only one that can attack along it
+        rays = RAYS[r][c]
+        enemy_queen = enemy_color + "Q"
+        for j in range(8):
+            slider = enemy_color + ("R" if j < 4 else "B")  # orthogonal rays first, then diagonal ones
+            for end_sq in rays[j]:
+                end_piece = board[end_sq[0]][end_sq[1]]
+                if end_piece != "--" and end_sq != empty_sq:
+                    if end_piece == slider or end_piece == enemy_queen:
+                        return True
+                    break
         return False
 
     '''
-    Returns if player is in check, a list of pins, a list of checks
+    Returns if player is in check, the pins as a dict from the pinned piece's square to the direction of the pin,
+    a list of checks
     '''
     def check_for_pins_and_checks(self):
-        pins = []
+        pins = {}
         checks = []
         in_check = False
 
@@ -505,101 +914,179 @@ class GameState:
             ally_color = "b"
             start_row = self.black_king_location[0]
             start_col = self.black_king_location[1]
+        board = self.board
         # check outward of king for pins and checks, keep track of pins
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            d = directions[j]
+        rays = RAYS[start_row][start_col]
+        enemy_queen = enemy_color + "Q"
+        for j in range(8):
+            d = DIRECTIONS[j]
+            slider = enemy_color + ("R" if j < 4 else "B")  # orthogonal rays first, then diagonal ones
             possible_pin = ()  # reset pin
-            for i in range(1, 8):
-                end_row = start_row + d[0]*i
-                end_col = start_col + d[1] * i
-                if 0 <= end_row < 8 and 0 <= end_col < 8:
-                    end_piece = self.board[end_row][end_col]
-                    if end_piece[0] == ally_color and end_piece[1] != "K":
-                        if possible_pin == ():  # 1st allied piece could be pinned
-                            possible_pin = (end_row, end_col, d[0], d[1])
-                        else:  # 2nd allied piece so no pin or check possible
-                            break
-                    elif end_piece[0] == enemy_color:
-                        type = end_piece[1]
-                        # 5 possibilities in this complex condition
-                        # 1. Orthogonally away from king and piece is a rook
-                        # 2. Diagonally away from king and piece is a bishop
-                        # 3. 1 square away diagonally from king and piece is a pawn
-                        # 4. any direction and piece is a queen
-                        # 5. any direction 1 square away and piece is a king (this is necessary to prevent king move to a square controlled by another king)
-                        if (0 <= j <= 3 and type == "R") or \
-                                (4 <= j <= 7 and type == "B") or \
-                                (i == 1 and type == "p" and ((enemy_color == "w" and 6 <= j <= 7) or (enemy_color == "b" and 4 <= j <= 5))) or \
-                                (type == "Q") or (i == 1 and type == "K"):
-                            if possible_pin == ():  # no piece blocking so check
-                                in_check = True
-                                checks.append((end_row, end_col, d[0], d[1]))
-                                break
-                            else:  # piece blocking so pin
-                                pins.append(possible_pin)
-                                break
-                        else:  # enemy piece not applying check
-                            break
-                else:  # off the board
-                    break
-
-        # check for knight checks
-        knight_moves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        for m in knight_moves:
-            end_row = start_row + m[0]
-            end_col = start_col + m[1]
-            if 0 <= end_row < 8 and 0 <= end_col < 8:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] == enemy_color and end_piece[1] == "N":  # enemy knight attacking king
-                    in_check = True
-                    checks.append((end_row, end_col, m[0], m[1]))
+            for end_row, end_col in rays[j]:
+                end_piece = board[end_row][end_col]
+                if end_piece == "--":
+                    continue
+                if end_piece[0] == ally_color:
+                    if possible_pin == ():  # 1st allied piece could be pinned
+                        possible_pin = (end_row, end_col)
+                    else:  # 2nd allied piece so no pin or check possible
+                        break
+                else:
+                    if end_piece == slider or end_piece == enemy_queen:
+                        if possible_pin == ():  # no piece blocking so check
+                            in_check = True
+                            checks.append((end_row, end_col, d[0], d[1]))
+                        else:  # piece blocking so pin
+                            pins[possible_pin] = d
+                    break  # any other enemy piece blocks the ray
+
+        # check for pawn and knight checks
+        enemy_pawn = enemy_color + "p"
+        for end_row, end_col in PAWN_ATTACKERS[enemy_color][start_row][start_col]:
+            if board[end_row][end_col] == enemy_pawn:
+                in_check = True
+                checks.append((end_row, end_col, end_row - start_row, end_col - start_col))
+        enemy_knight = enemy_color + "N"
+        for end_row, end_col in KNIGHT_TARGETS[start_row][start_col]:
+            if board[end_row][end_col] == enemy_knight:
+                in_check = True
+                checks.append((end_row, end_col, end_row - start_row, end_col - start_col))
         return in_check, pins, checks
 
     '''
     Update the castle rights given the move
     '''
     def update_castle_rights(self, move):
-        if move.piece_moved == "wK":
-            self.white_castle_kingside = False
-            self.white_castle_Queenside = False
-        elif move.piece_moved == "bK":
-            self.black_castle_kingside = False
-            self.black_castle_Queenside = False
-        elif move.piece_moved == "wR":
-            if move.start_row == 7:
-                if move.start_col == 0:  # left rook
-                    self.white_castle_Queenside = False
-                elif move.start_col == 7:
-                    self.white_castle_kingside = False
-        elif move.piece_moved == "bR":
-            if move.start_row == 0:
-                if move.start_col == 0:  # left rook
-                    self.black_castle_Queenside = False
-                elif move.start_col == 7:
-                    self.black_castle_kingside = False
-
-        # if rook is captured
-        if move.piece_capture == "wR":
-            if move.end_row == 7:
-                if move.end_col == 0:
-                    self.white_castle_Queenside = False
-                elif move.end_col == 7:
-                    self.white_castle_kingside = False
-        elif move.piece_capture == "bR":
-            if move.end_row == 0:
-                if move.end_col == 0:
-                    self.black_castle_Queenside = False
-                elif move.end_col == 7:
-                    self.black_castle_kingside = False
-
-
-class CastleRights():
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
+        self.castle_rights &= CASTLE_RIGHTS_KEPT[move.start_row*8 + move.start_col] & \
+            CASTLE_RIGHTS_KEPT[move.end_row*8 + move.end_col]
+
+    # the single castle rights, read from and written to the bits of self.castle_rights
+    @property
+    def white_castle_kingside(self):
+        return self.castle_rights & WHITE_KINGSIDE != 0
+
+    @white_castle_kingside.setter
+    def white_castle_kingside(self, value):
+        self.castle_rights = self.castle_rights | WHITE_KINGSIDE if value else self.castle_rights & ~WHITE_KINGSIDE
+
+    @property
+    def white_castle_Queenside(self):
+        return self.castle_rights & WHITE_QUEENSIDE != 0
+
+    @white_castle_Queenside.setter
+    def white_castle_Queenside(self, value):
+        self.castle_rights = self.castle_rights | WHITE_QUEENSIDE if value else self.castle_rights & ~WHITE_QUEENSIDE
+
+    @property
+    def black_castle_kingside(self):
+        return self.castle_rights & BLACK_KINGSIDE != 0
+
+    @black_castle_kingside.setter
+    def black_castle_kingside(self, value):
+        self.castle_rights = self.castle_rights | BLACK_KINGSIDE if value else self.castle_rights & ~BLACK_KINGSIDE
+
+    @property
+    def black_castle_Queenside(self):
+        return self.castle_rights & BLACK_QUEENSIDE != 0
+
+    @black_castle_Queenside.setter
+    def black_castle_Queenside(self, value):
+        self.castle_rights = self.castle_rights | BLACK_QUEENSIDE if value else self.castle_rights & ~BLACK_QUEENSIDE
+
+    '''
+    Hash the whole position from scratch. make_move/undo_move keep self.zobrist_key equal to this incrementally.
+    '''
+    def compute_zobrist_key(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] != "--":
+                    key ^= ZOBRIST_PIECES[self.board[r][c]][r][c]
+        if not self.white_to_move:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        if self.en_passant_possible != ():
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_possible[1]]
+        return key ^ ZOBRIST_CASTLE_RIGHTS[self.castle_rights]
+
+    '''
+    XOR the changes made by the move into the Zobrist key. Called by make_move after the board has been updated.
+    '''
+    def update_zobrist_key(self, move, old_en_passant, old_castle_rights):
+        key = self.zobrist_key ^ ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_PIECES[move.piece_moved][move.start_row][move.start_col]
+        # the piece on the end square, which is a queen after a promotion
+        key ^= ZOBRIST_PIECES[self.board[move.end_row][move.end_col]][move.end_row][move.end_col]
+        if move.en_passant:
+            key ^= ZOBRIST_PIECES[move.piece_capture][move.start_row][move.end_col]
+        elif move.piece_capture != "--":
+            key ^= ZOBRIST_PIECES[move.piece_capture][move.end_row][move.end_col]
+        if move.castle:
+            rook = move.piece_moved[0] + "R"
+            if move.end_col - move.start_col == 2:  # kingside
+                key ^= ZOBRIST_PIECES[rook][move.end_row][7] ^ ZOBRIST_PIECES[rook][move.end_row][5]
+            else:  # Queenside
+                key ^= ZOBRIST_PIECES[rook][move.end_row][0] ^ ZOBRIST_PIECES[rook][move.end_row][3]
+        if old_en_passant != ():
+            key ^= ZOBRIST_EN_PASSANT[old_en_passant[1]]
+        if self.en_passant_possible != ():
+            key ^= ZOBRIST_EN_PASSANT[self.en_passant_possible[1]]
+        self.zobrist_key = key ^ ZOBRIST_CASTLE_RIGHTS[old_castle_rights] ^ \
+            ZOBRIST_CASTLE_RIGHTS[self.castle_rights]
+
+    '''
+    Material and piece-square totals of the whole board. make_move/undo_move keep self.material_score and
+    self.position_score equal to this incrementally.
+    '''
+    def compute_eval_scores(self):
+        material_score = position_score = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    material_score += PIECE_MATERIAL[piece]
+                    position_score += PIECE_POSITION_SCORES[piece][r][c]
+        return material_score, position_score
+
+    def count_pieces(self):
+        return sum(1 for row in self.board for piece in row if piece != "--")
+
+    '''
+    pieces_score total of the knights, bishops, rooks and queens of each colour, {"w": ..., "b": ...}
+    '''
+    def count_non_pawn_material(self):
+        material = {"w": 0, "b": 0}
+        for row in self.board:
+            for piece in row:
+                if piece != "--" and piece[1] != "p":
+                    material[piece[0]] += pieces_score[piece[1]]
+        return material
+
+    '''
+    Add (sign=1, make_move) or take back (sign=-1, undo_move) the change in material and piece-square totals
+    and in the piece count and non-pawn material caused by the move
+    '''
+    def update_eval_scores(self, move, sign):
+        piece = move.piece_moved
+        end_piece = piece[0] + move.promotion_piece if move.pawn_promotion else piece
+        material = PIECE_MATERIAL[end_piece] - PIECE_MATERIAL[piece]
+        position = PIECE_POSITION_SCORES[end_piece][move.end_row][move.end_col] - \
+            PIECE_POSITION_SCORES[piece][move.start_row][move.start_col]
+        if move.piece_capture != "--":
+            capture_row = move.start_row if move.en_passant else move.end_row
+            material -= PIECE_MATERIAL[move.piece_capture]
+            position -= PIECE_POSITION_SCORES[move.piece_capture][capture_row][move.end_col]
+            self.piece_count -= sign
+            if move.piece_capture[1] != "p":
+                self.non_pawn_material[move.piece_capture[0]] -= sign * pieces_score[move.piece_capture[1]]
+        if move.pawn_promotion:
+            self.non_pawn_material[piece[0]] += sign * pieces_score[move.promotion_piece]
+        if move.castle:
+            rook = PIECE_POSITION_SCORES[piece[0] + "R"][move.end_row]
+            if move.end_col - move.start_col == 2:  # kingside
+                position += rook[5] - rook[7]
+            else:  # Queenside
+                position += rook[3] - rook[0]
+        self.material_score += sign * material
+        self.position_score += sign * position
 
 
 class Move:
@@ -613,35 +1100,64 @@ class Move:
 
     cols_to_files = {v: k for k, v in files_to_cols.items()}
 
-    def __init__(self, start_sq, end_sq, board, en_passant=False, castle=False):
-        self.start_row = start_sq[0]
-        self.start_col = start_sq[1]
-        self.end_row = end_sq[0]
-        self.end_col = end_sq[1]
-        self.piece_moved = board[self.start_row][self.start_col]
-        self.piece_capture = board[self.end_row][self.end_col]
+    promotion_pieces = ("Q", "R", "B", "N")
+    promotion_index = {"Q": 0, "R": 1, "B": 2, "N": 3}
+
+    # A move is identified by a 14 bit int (self.move_id): bits 0-5 start square, 6-11 end square (row*8 + col),
+    # 12-13 promotion piece. It is used for equality, hashing, the transposition table and the killer moves.
+
+    # no __dict__ per move, the search creates a lot of them
+    __slots__ = ("start_row", "start_col", "end_row", "end_col", "piece_moved", "piece_capture", "en_passant",
+                 "pawn_promotion", "promotion_piece", "castle", "is_capture", "move_id")
+
+    def __init__(self, start_sq, end_sq, board, en_passant=False, castle=False, promotion_piece="Q"):
+        self.start_row, self.start_col = start_row, start_col = start_sq
+        self.end_row, self.end_col = end_row, end_col = end_sq
+        self.piece_moved = piece_moved = board[start_row][start_col]
         self.en_passant = en_passant
         if en_passant:
-            self.piece_capture = "bp" if self.piece_moved == "wp" else "wp"  # en passant capture opposite color pawn
-
-        self.pawn_promotion = (self.piece_moved == "wp" and self.end_row == 0) or (
-                                self.piece_moved == "bp" and self.end_row == 7)
+            self.piece_capture = "bp" if piece_moved == "wp" else "wp"  # en passant capture opposite color pawn
+        else:
+            self.piece_capture = board[end_row][end_col]
 
+        self.pawn_promotion = piece_moved[1] == "p" and (end_row == 0 or end_row == 7)
         self.castle = castle
 
         self.is_capture = self.piece_capture != "--"
-        self.move_id = self.start_row*1000 + self.start_col*100 + self.end_row*10 + self.end_col
+        move_id = start_row*8 + start_col | (end_row*8 + end_col) << 6
+        if self.pawn_promotion:  # under-promotions get their own id, a queen promotion keeps the plain one
+            self.promotion_piece = promotion_piece
+            move_id |= self.promotion_index[promotion_piece] << 12
+        else:
+            self.promotion_piece = ""
+        self.move_id = move_id
+
+    '''
+    Which kind of move this is for the staged move generation: CAPTURES, QUIETS or CASTLES
+    '''
+    def gen_type(self):
+        if self.castle:
+            return CASTLES
+        if self.is_capture or self.pawn_promotion:
+            return CAPTURES
+        return QUIETS
+
     '''
     Overriding equals method
     '''
     def __eq__(self, other):
-        if isinstance(other, Move):
+        try:
             return self.move_id == other.move_id
-        return False
+        except AttributeError:
+            return False
+
+    def __hash__(self):
+        return self.move_id
 
     def get_chess_notations(self):
         # you can add to make this a real chess notation
-        return self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col)
+        return self.get_rank_file(self.start_row, self.start_col) + self.get_rank_file(self.end_row, self.end_col) + \
+            self.promotion_piece.lower()
 
     def get_rank_file(self, r, c):
         return self.cols_to_files[c] + self.rows_to_ranks[r]
@@ -654,15 +1170,15 @@ class Move:
 
         end_square = self.get_rank_file(self.end_row, self.end_col)
 
-        # pawn moves
+        # pawn moves and pawn promotions
         if self.piece_moved[1] == "p":
+            if self.pawn_promotion:
+                end_square += "=" + self.promotion_piece
             if self.is_capture:
                 return self.cols_to_files[self.start_col] + "x" + end_square
             else:
                 return end_square
 
-        # pawn promotions
-
         # two of same type of piece moving to a square
 
         # also adding + for check move and # for checkmate
@@ -0,0 +1,141 @@
+"""
+Long-lived engine process for the GUI. The worker keeps its own GameState and its search caches (transposition
+table) between moves, so instead of pickling the whole GameState for every AI move the GUI only sends the moves
+played since the last search. Everything goes over one Pipe, including cancelling a search: any message that
+arrives while the worker is searching stops the search. If a move sent doesn't match a legal move of the worker's
+position the worker says so and refuses to search until the GUI has resent the whole game.
+"""
+from multiprocessing import Process, Pipe
+
+import ChessEngine
+import ChessAI
+import BitboardEngine
+
+
+class EngineWorker:
+    def __init__(self, use_bitboards=True, workers=1):
+        self.connection, worker_connection = Pipe()
+        self.process = Process(target=run_engine_worker, args=(worker_connection, use_bitboards))
+        self.process.start()
+        self.workers = workers  # processes used by each search, see ChessAI.find_best_move_parallel
+        self.synced_moves = []  # move ids of the moves the worker has played from the starting position
+        self.search_id = 0  # replies to cancelled searches are recognised by their id and dropped
+        self.searching = False
+        self.search_limits = None  # (time_limit, max_depth) of the current search, to restart it after a resync
+        self.resyncing = False
+
+    '''
+    Bring the worker's position up to date with gs by taking back the moves that are no longer in the move log and
+    sending the new ones
+    '''
+    def sync(self, gs):
+        move_ids = [move.move_id for move in gs.move_log]
+        common = 0
+        while common < len(self.synced_moves) and common < len(move_ids) and \
+                self.synced_moves[common] == move_ids[common]:
+            common += 1
+        if common < len(self.synced_moves):
+            self.connection.send(("undo", len(self.synced_moves) - common))
+        if common < len(move_ids):
+            self.connection.send(("moves", move_ids[common:]))
+        self.synced_moves = move_ids
+
+    '''
+    Full resync after the worker reported a mismatch: take back every move and send the whole game again
+    '''
+    def resync(self):
+        self.connection.send(("reset",))
+        if self.synced_moves:
+            self.connection.send(("moves", self.synced_moves))
+
+    '''
+    Start searching the position of gs, the result is picked up with poll_result
+    '''
+    def start_search(self, gs, time_limit=None, max_depth=ChessAI.DEPTH):
+        self.sync(gs)
+        self.send_go(time_limit, max_depth)
+        self.resyncing = False
+
+    def send_go(self, time_limit, max_depth):
+        self.search_id += 1
+        self.search_limits = (time_limit, max_depth)
+        self.connection.send(("go", self.search_id, time_limit, max_depth, self.workers))
+        self.searching = True
+
+    '''
+    Cancel the current search, its result will be ignored
+    '''
+    def stop(self):
+        if self.searching:
+            self.connection.send(("stop",))
+            self.searching = False
+
+    '''
+    Returns (True, move id) once the current search has finished, the move id is None if no move was found.
+    Returns (False, None) while it is still searching.
+    '''
+    def poll_result(self):
+        while self.connection.poll():
+            reply = self.connection.recv()
+            if reply[0] == "best_move" and reply[1] == self.search_id and self.searching:
+                self.searching = False
+                return True, reply[2]
+            if reply[0] == "out_of_sync" and self.searching:
+                # the worker didn't search the go that followed, resend the game and search again once.
+                # A second mismatch means the moves themselves are wrong, the search ends without a move.
+                if self.resyncing:
+                    self.searching = False
+                    return True, None
+                self.resyncing = True
+                self.resync()
+                self.send_go(*self.search_limits)
+        return False, None
+
+    def close(self):
+        self.connection.send(("quit",))
+        self.process.join()
+
+
+'''
+Main loop of the worker process
+'''
+
+
+def run_engine_worker(connection, use_bitboards):
+    gs = BitboardEngine.BitboardGameState() if use_bitboards else ChessEngine.GameState()
+    in_sync = True  # False from a move that didn't apply until the next reset
+    while True:
+        message = connection.recv()
+        command = message[0]
+        if command == "quit":
+            break
+        elif command == "reset":
+            while gs.move_log:
+                gs.undo_move()
+            in_sync = True
+        elif command == "undo" and in_sync:
+            if message[1] > len(gs.move_log):
+                in_sync = False
+                connection.send(("out_of_sync", None))
+                continue
+            for i in range(message[1]):
+                gs.undo_move()
+        elif command == "moves" and in_sync:
+            for move_id in message[1]:
+                for move in gs.get_valid_moves():
+                    if move.move_id == move_id:
+                        gs.make_move(move)
+                        break
+                else:
+                    in_sync = False
+                    connection.send(("out_of_sync", move_id))
+                    break
+        elif command == "go" and in_sync:
+            search_id, time_limit, max_depth, workers = message[1:]
+            # connection.poll is the stop check, so any new message (stop, undo, moves, quit) ends the search
+            best_move = ChessAI.find_best_move(gs, gs.get_valid_moves(), time_limit=time_limit, max_depth=max_depth,
+                                               stop_check=connection.poll, workers=workers)
+            connection.send(("best_move", search_id, best_move.move_id if best_move is not None else None))
+        # "stop" needs nothing more, the search it cancels has already returned when it is read. Out of sync,
+        # undo/moves/go are dropped until the reset, the GUI restarts the search after resending the game.
+    connection.close()
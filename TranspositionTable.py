@@ -0,0 +1,150 @@
+"""
+Transposition table for the search. Results are keyed by the Zobrist key of the position and stored in flat,
+preallocated arrays (no Python object per entry), so the memory used is fixed by the size given in MB.
+Each bucket has two slots: the first one keeps the deepest search, the second one is always replaced.
+SharedTranspositionTable keeps its slots in shared memory for the processes of a parallel search.
+"""
+import ctypes
+from array import array
+from multiprocessing.sharedctypes import RawArray
+
+# bound type of a stored score
+EXACT = 0
+LOWER_BOUND = 1  # the search failed high, the real score is at least this
+UPPER_BOUND = 2  # the search failed low, the real score is at most this
+
+NO_MOVE = 0
+ENTRY_SIZE = 24  # bytes per slot: key (8), score (8), packed depth/bound/move (8)
+SLOTS_PER_BUCKET = 2
+SHARED_ENTRY_SIZE = 16  # bytes per slot of the shared table: checked key (8), packed depth/bound/move/score (8)
+SCORE_SCALE = 100  # the shared table stores scores as integers in hundredths, scores move in steps of .1
+
+
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        self.resize(size_mb)
+
+    '''
+    Allocate a new, empty table using about size_mb megabytes
+    '''
+    def resize(self, size_mb):
+        self.size_mb = size_mb
+        self.bucket_count = max(1, int(size_mb * 1024 * 1024) // (ENTRY_SIZE * SLOTS_PER_BUCKET))
+        slot_count = self.bucket_count * SLOTS_PER_BUCKET
+        self.keys = array("Q", [0]) * slot_count
+        self.scores = array("d", [0.0]) * slot_count
+        # (depth + 1) | bound << 8 | move << 10, 0 marks an empty slot
+        self.data = array("q", [0]) * slot_count
+        self.reset_stats()
+
+    def clear(self):
+        self.resize(self.size_mb)
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.cutoffs = 0
+        self.stores = 0
+        self.overwrites = 0
+
+    '''
+    Returns (depth, score, bound, move) for the key or None if the position is not in the table
+    '''
+    def probe(self, key):
+        self.probes += 1
+        slot = (key % self.bucket_count) * SLOTS_PER_BUCKET
+        for i in (slot, slot + 1):
+            data = self.data[i]
+            if data and self.keys[i] == key:
+                self.hits += 1
+                return (data & 0xFF) - 1, self.scores[i], (data >> 8) & 3, data >> 10
+        return None
+
+    '''
+    Store a search result. The depth-preferred slot is only replaced by a search at least as deep (or by the same
+    position), everything else goes to the always-replace slot.
+    '''
+    def store(self, key, depth, score, bound, move=NO_MOVE):
+        slot = (key % self.bucket_count) * SLOTS_PER_BUCKET
+        data = self.data[slot]
+        if data and self.keys[slot] != key and depth < (data & 0xFF) - 1:
+            slot += 1  # keep the deeper entry, use the always-replace slot
+            data = self.data[slot]
+        if data and self.keys[slot] != key:
+            self.overwrites += 1
+        self.stores += 1
+        self.keys[slot] = key
+        self.scores[slot] = score
+        self.data[slot] = (depth + 1) | bound << 8 | move << 10
+
+    '''
+    Counters used to size the table
+    '''
+    def stats(self):
+        used = sum(1 for data in self.data if data)
+        return {"size_mb": self.size_mb, "entries": len(self.data), "used": used, "probes": self.probes,
+                "hits": self.hits, "cutoffs": self.cutoffs, "stores": self.stores, "overwrites": self.overwrites}
+
+
+class SharedTranspositionTable(TranspositionTable):
+    '''
+    A table in shared memory, every process of a parallel search reads and writes the same slots (Lazy SMP).
+    There are no locks: the score is packed into the data word with depth, bound and move, and the key slot holds
+    key ^ data, so a slot another process was halfway through writing doesn't match the key and reads as a miss.
+    The processes get the arrays of an existing table through shared_keys and shared_data.
+    '''
+    def __init__(self, size_mb=16, shared_keys=None, shared_data=None):
+        if shared_keys is None:
+            self.resize(size_mb)
+        else:
+            self.size_mb = size_mb
+            self.bucket_count = len(shared_keys) // SLOTS_PER_BUCKET
+            self.attach(shared_keys, shared_data)
+            self.reset_stats()
+
+    def resize(self, size_mb):
+        self.size_mb = size_mb
+        self.bucket_count = max(1, int(size_mb * 1024 * 1024) // (SHARED_ENTRY_SIZE * SLOTS_PER_BUCKET))
+        slot_count = self.bucket_count * SLOTS_PER_BUCKET
+        self.attach(RawArray("Q", slot_count), RawArray("q", slot_count))
+        self.reset_stats()
+
+    def attach(self, shared_keys, shared_data):
+        self.shared_keys = shared_keys
+        self.shared_data = shared_data
+        # memoryviews index much faster than the ctypes arrays
+        self.keys = memoryview(shared_keys).cast("B").cast("Q")
+        self.data = memoryview(shared_data).cast("B").cast("q")
+
+    '''
+    Empty the table in place, the other processes keep using the same memory
+    '''
+    def clear(self):
+        ctypes.memset(self.shared_keys, 0, ctypes.sizeof(self.shared_keys))
+        ctypes.memset(self.shared_data, 0, ctypes.sizeof(self.shared_data))
+        self.reset_stats()
+
+    def probe(self, key):
+        self.probes += 1
+        slot = (key % self.bucket_count) * SLOTS_PER_BUCKET
+        for i in (slot, slot + 1):
+            data = self.data[i]
+            if data and self.keys[i] ^ (data & 0xFFFFFFFFFFFFFFFF) == key:
+                self.hits += 1
+                return (data & 0xFF) - 1, (data >> 24) / SCORE_SCALE, (data >> 8) & 3, (data >> 10) & 0x3FFF
+        return None
+
+    def store(self, key, depth, score, bound, move=NO_MOVE):
+        slot = (key % self.bucket_count) * SLOTS_PER_BUCKET
+        data = self.data[slot]
+        stored_key = self.keys[slot] ^ (data & 0xFFFFFFFFFFFFFFFF)
+        if data and stored_key != key and depth < (data & 0xFF) - 1:
+            slot += 1  # keep the deeper entry, use the always-replace slot
+            data = self.data[slot]
+            stored_key = self.keys[slot] ^ (data & 0xFFFFFFFFFFFFFFFF)
+        if data and stored_key != key:
+            self.overwrites += 1
+        self.stores += 1
+        data = (depth + 1) | bound << 8 | move << 10 | int(round(score * SCORE_SCALE)) << 24
+        self.data[slot] = data
+        self.keys[slot] = key ^ (data & 0xFFFFFFFFFFFFFFFF)
@@ -0,0 +1,178 @@
+"""
+EPD test suite runner, the standard benchmark for engine builds. Each line of the suite is a position in EPD (the
+first 4 fields of a FEN) followed by operations such as bm (best moves), am (moves to avoid) and id. The engine
+searches every position with the same budget and a position counts as solved when the move found is one of the bm
+moves and none of the am moves. The file is read one line at a time, so suites of any size can be run.
+
+Usage:
+    python epd.py suite.epd                         1 second per position
+    python epd.py suite.epd --movetime 5 --backend board
+    python epd.py suite.epd --depth 6 --limit 100   first 100 positions to depth 6
+The report lists each position, then the solve rate and the nodes per second over the whole suite.
+"""
+import argparse
+import re
+import sys
+import time
+
+import ChessEngine
+import BitboardEngine
+import ChessAI
+
+BACKENDS = {"board": ChessEngine.GameState, "bitboard": BitboardEngine.BitboardGameState}
+DEFAULT_MOVETIME = 1.0  # seconds per position when no budget is given
+
+# one operation: an opcode and its operands up to the next ";" that isn't inside quotes
+EPD_OPERATION = re.compile(r'\s*([A-Za-z]\w*)((?:\s*(?:"[^"]*"|[^\s;"]+))*)\s*;')
+EPD_OPERAND = re.compile(r'"([^"]*)"|([^\s"]+)')
+
+
+'''
+Parse an EPD line into (FEN, operations), where operations maps each opcode to its list of operands. The hmvc and
+fmvn operations give the clocks of the FEN when present. Returns None for blank lines and comments.
+'''
+
+
+def parse_epd(line):
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("Invalid EPD, expected 4 position fields: " + line)
+    operations = {}
+    for opcode, operands in EPD_OPERATION.findall(fields[4] if len(fields) > 4 else ""):
+        operations[opcode] = [quoted or plain for quoted, plain in EPD_OPERAND.findall(operands)]
+    clocks = [operations.get("hmvc", ["0"])[0], operations.get("fmvn", ["1"])[0]]
+    return " ".join(fields[:4] + clocks), operations
+
+
+'''
+Yield (line number, FEN, operations) for each position of an open EPD file, reading it lazily. A malformed line
+gives (line number, None, error message) so the run can report it and go on.
+'''
+
+
+def read_epd(epd_file):
+    for line_number, line in enumerate(epd_file, 1):
+        try:
+            position = parse_epd(line)
+        except ValueError as error:
+            yield line_number, None, str(error)
+            continue
+        if position is not None:
+            yield (line_number,) + position
+
+
+'''
+Standard algebraic notation of a move without the check suffix, disambiguated against the other valid moves
+'''
+
+
+def san(move, valid_moves):
+    if move.castle or move.piece_moved[1] == "p":
+        return str(move)
+    others = [other for other in valid_moves if other.piece_moved == move.piece_moved and other != move and
+              other.end_row == move.end_row and other.end_col == move.end_col]
+    origin = ""
+    if others:
+        if all(other.start_col != move.start_col for other in others):
+            origin = move.cols_to_files[move.start_col]
+        elif all(other.start_row != move.start_row for other in others):
+            origin = move.rows_to_ranks[move.start_row]
+        else:
+            origin = move.get_rank_file(move.start_row, move.start_col)
+    return move.piece_moved[1] + origin + ("x" if move.is_capture else "") + \
+        move.get_rank_file(move.end_row, move.end_col)
+
+
+'''
+The valid moves matching the move texts of a bm or am operation. SAN is compared without check, capture and
+annotation marks so "Nxf7+" matches "Nf7", and coordinate notation ("g1f3") is accepted as well.
+'''
+
+
+def find_moves(texts, valid_moves):
+    def normalize(text):
+        return re.sub(r"[+#!?=x]", "", text).replace("0", "O").replace("ep", "")
+
+    wanted = set(normalize(text) for text in texts)
+    return [move for move in valid_moves
+            if normalize(san(move, valid_moves)) in wanted or move.get_chess_notations() in texts]
+
+
+'''
+Search each position of the suite and write one line per position and a summary to out. Returns the number of
+positions solved and the number run.
+'''
+
+
+def run_suite(positions, backend, time_limit, node_limit, max_depth, workers=1, limit=None, out=sys.stdout):
+    solved = total = total_nodes = 0
+    total_time = 0.0
+    for line_number, fen, operations in positions:
+        if limit is not None and total >= limit:
+            break
+        if fen is None:
+            out.write("%-20s skipped, %s\n" % ("line " + str(line_number), operations))
+            continue
+        name = operations.get("id", ["line " + str(line_number)])[0]
+        try:
+            gs = BACKENDS[backend](fen)
+        except (ValueError, KeyError) as error:
+            out.write("%-20s skipped, %s\n" % (name, error))
+            continue
+        valid_moves = gs.get_valid_moves()
+        best_moves = find_moves(operations.get("bm", []), valid_moves)
+        avoid_moves = find_moves(operations.get("am", []), valid_moves)
+        if not valid_moves or not (best_moves or avoid_moves):
+            out.write("%-20s skipped, no valid move or no bm/am move found\n" % name)
+            continue
+
+        ChessAI.transposition_table.clear()  # every position starts from the same state
+        start_time = time.perf_counter()
+        move = ChessAI.find_best_move(gs, valid_moves, time_limit=time_limit, node_limit=node_limit,
+                                      max_depth=max_depth, workers=workers, use_book=False)
+        elapsed = time.perf_counter() - start_time
+        passed = move is not None and (not best_moves or move in best_moves) and move not in avoid_moves
+        total += 1
+        solved += passed
+        total_nodes += ChessAI.nodes
+        total_time += elapsed
+        out.write("%-20s %-6s %-8s %-16s depth %2d %10d nodes %7.2fs\n" % (
+            name, "ok" if passed else "FAIL", san(move, valid_moves) if move is not None else "none",
+            ("bm " + " ".join(operations["bm"])) if "bm" in operations else ("am " + " ".join(operations["am"])),
+            ChessAI.completed_depth, ChessAI.nodes, elapsed))
+    out.write("solved %d/%d (%.1f%%), %d nodes in %.2fs, %.0f nodes/s\n" % (
+        solved, total, 100 * solved / total if total else 0, total_nodes, total_time,
+        total_nodes / total_time if total_time else 0))
+    return solved, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the engine on an EPD test suite")
+    parser.add_argument("suite", help="EPD file, - for stdin")
+    parser.add_argument("--movetime", type=float, help="seconds per position (default %g if no other budget)" %
+                        DEFAULT_MOVETIME)
+    parser.add_argument("--nodes", type=int, help="nodes per position")
+    parser.add_argument("--depth", type=int, help="deepest iteration per position")
+    parser.add_argument("--backend", choices=tuple(BACKENDS), default="bitboard")
+    parser.add_argument("--workers", type=int, default=1, help="search processes per position")
+    parser.add_argument("--limit", type=int, help="only run the first LIMIT positions")
+    args = parser.parse_args(argv)
+
+    time_limit = args.movetime
+    if time_limit is None and args.nodes is None and args.depth is None:
+        time_limit = DEFAULT_MOVETIME
+    max_depth = args.depth if args.depth is not None else ChessAI.MAX_DEPTH
+    epd_file = sys.stdin if args.suite == "-" else open(args.suite)
+    try:
+        run_suite(read_epd(epd_file), args.backend, time_limit, args.nodes, max_depth, args.workers, args.limit)
+    finally:
+        if epd_file is not sys.stdin:
+            epd_file.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,7 +6,8 @@ the current GameState object.
 import pygame as p
 import ChessEngine
 import ChessAI
-from multiprocessing import Process, Queue
+import BitboardEngine
+import EngineWorker
 
 BOARD_WIDTH = BOARD_HEIGHT = 512  # 400 is also another option
 MOVE_LOG_PANEL_WIDTH = 250
@@ -14,6 +15,9 @@ MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT
 DIMENSION = 8  # dimension of chess board are 8x8
 SQ_SIZE = BOARD_HEIGHT // DIMENSION
 MAX_FPS = 15  # for animations
+AI_THINKING_TIME = 5  # seconds the AI may spend on a move
+AI_WORKERS = 1  # processes the AI searches with, see ChessAI.find_best_move_parallel
+USE_BITBOARDS = True  # search on the bitboard backend instead of the 8x8 list board
 IMAGES = {}
 
 '''
@@ -28,6 +32,17 @@ def load_images():
     # NOTE: we can access an image by saying 'IMAGES['wp']
 
 
+'''
+Create a new game in the starting position, using the backend selected by USE_BITBOARDS
+'''
+
+
+def new_game_state():
+    if USE_BITBOARDS:
+        return BitboardEngine.BitboardGameState()
+    return ChessEngine.GameState()
+
+
 '''
 The main driver for our code. This will handle user input and updating the graphics.
 '''
@@ -39,7 +54,7 @@ def main():
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
     move_log_font = p.font.SysFont("Arial", 14, False, False)
-    gs = ChessEngine.GameState()
+    gs = new_game_state()
     valid_moves = gs.get_valid_moves()
     move_made = False  # flag variable when a move is made
     animate = False  # flag variable when we should animate a move
@@ -51,7 +66,7 @@ def main():
     player_one = True  # If human is playing white, then this is true. If AI is playing, then it is false
     player_two = False  # same as above but for black
     AI_thinking = False
-    move_finder_process = None
+    engine = EngineWorker.EngineWorker(USE_BITBOARDS, AI_WORKERS)  # one engine process for the whole session
     move_undone = False
 
     while running:
@@ -96,11 +111,11 @@ def main():
                     animate = False
                     game_over = False
                     if AI_thinking:
-                        move_finder_process.terminate()
+                        engine.stop()
                         AI_thinking = False
                     move_undone = True
                 if e.key == p.K_r:  # reset the board when r is pressed
-                    gs = ChessEngine.GameState()
+                    gs = new_game_state()
                     valid_moves = gs.get_valid_moves()
                     sq_selected = ()
                     player_clicks = []
@@ -108,7 +123,7 @@ def main():
                     animate = False
                     game_over = False
                     if AI_thinking:
-                        move_finder_process.terminate()
+                        engine.stop()
                         AI_thinking = False
                     move_undone = True
 
@@ -117,13 +132,15 @@ def main():
             if not AI_thinking:
                 AI_thinking = True
                 print("thinking...")
-                return_queue = Queue()  # used to pass data between threads
-                move_finder_process = Process(target=ChessAI.find_best_move, args=(gs, valid_moves, return_queue))
-                move_finder_process.start()  # call find_best_move(gs, valid_moves, return_queue)
+                engine.start_search(gs, AI_THINKING_TIME, ChessAI.MAX_DEPTH)  # sends only the new moves
 
-            if not move_finder_process.is_alive():
+            search_done, AI_move_id = engine.poll_result()
+            if search_done:
                 print("done thinking")
-                AI_move = return_queue.get()
+                AI_move = None
+                for move in valid_moves:
+                    if move.move_id == AI_move_id:
+                        AI_move = move
                 if AI_move is None:
                     AI_move = ChessAI.find_random_move(valid_moves)
                 gs.make_move(AI_move)
@@ -152,6 +169,8 @@ def main():
         clock.tick(MAX_FPS)
         p.display.flip()
 
+    engine.close()
+
 
 '''
 Responsible for all the graphics within a current game state.
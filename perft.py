@@ -0,0 +1,145 @@
+"""
+Perft (performance test) for the move generator. It counts the leaf nodes of the legal move tree to a given depth
+and compares them with the published counts of a set of well known positions, so it is both a regression suite for
+get_valid_moves/make_move/undo_move and a speed benchmark (nodes per second) for the GameState backends.
+
+Usage:
+    python perft.py                                 run every position to depth 3 on both backends
+    python perft.py --depth 4 --backend bitboard
+    python perft.py --position kiwipete --divide 2  node count per root move, to track down a wrong count
+    python perft.py --fen "8/8/8/8/8/8/6k1/4K2R w K - 0 1" --depth 4
+The exit code is 1 if any count differs from the published one.
+"""
+import argparse
+import sys
+import time
+
+import ChessEngine
+import BitboardEngine
+
+BACKENDS = {"board": ChessEngine.GameState, "bitboard": BitboardEngine.BitboardGameState}
+
+# name, FEN and the published node counts for depth 1, 2, 3, ...
+PERFT_POSITIONS = [
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",  # en passant pins along the rank
+     [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",  # promotions, castling
+     [6, 264, 9467, 422333]),
+    ("position4-mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+DEFAULT_DEPTH = 3
+
+
+'''
+Number of leaf nodes of the legal move tree depth plies deep. The last ply is counted without making the moves.
+'''
+
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.get_valid_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.make_move(move)
+        nodes += perft(gs, depth - 1)
+        gs.undo_move()
+    return nodes
+
+
+'''
+Perft split by root move, returns a list of (move notation, node count)
+'''
+
+
+def divide(gs, depth):
+    results = []
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        results.append((move.get_chess_notations(), perft(gs, depth - 1)))
+        gs.undo_move()
+    return results
+
+
+def new_position(backend, fen):
+    return BACKENDS[backend](fen)
+
+
+'''
+Run perft on each position up to max_depth and print the counts and speed. Returns False if a count is wrong.
+'''
+
+
+def run_suite(positions, max_depth, backends, out=sys.stdout):
+    all_passed = True
+    total_nodes = 0
+    total_time = 0.0
+    for backend in backends:
+        for name, fen, expected_counts in positions:
+            gs = new_position(backend, fen)
+            depths = range(1, max_depth + 1) if not expected_counts else range(1, min(max_depth, len(expected_counts)) + 1)
+            for depth in depths:
+                start_time = time.perf_counter()
+                nodes = perft(gs, depth)
+                elapsed = time.perf_counter() - start_time
+                total_nodes += nodes
+                total_time += elapsed
+                if expected_counts:
+                    passed = nodes == expected_counts[depth - 1]
+                    result = "ok" if passed else "FAIL (expected " + str(expected_counts[depth - 1]) + ")"
+                    all_passed = all_passed and passed
+                else:
+                    result = ""
+                out.write("%-9s %-19s depth %d %10d nodes %8.2fs %9.0f nodes/s  %s\n" %
+                          (backend, name, depth, nodes, elapsed, nodes / elapsed if elapsed else 0, result))
+    out.write("total %d nodes in %.2fs, %.0f nodes/s\n" % (total_nodes, total_time,
+                                                          total_nodes / total_time if total_time else 0))
+    return all_passed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft node counts for the chess move generator")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="deepest perft to run")
+    parser.add_argument("--backend", choices=("board", "bitboard", "both"), default="both")
+    parser.add_argument("--position", action="append", help="only run the named position (can be repeated)")
+    parser.add_argument("--fen", help="run a custom position instead of the standard set")
+    parser.add_argument("--divide", type=int, metavar="DEPTH", help="print the node count of each root move")
+    args = parser.parse_args(argv)
+
+    backends = ["board", "bitboard"] if args.backend == "both" else [args.backend]
+    if args.fen:
+        positions = [("custom", args.fen, [])]
+    else:
+        positions = PERFT_POSITIONS
+        if args.position:
+            unknown = set(args.position) - set(name for name, fen, counts in PERFT_POSITIONS)
+            if unknown:
+                parser.error("unknown position " + ", ".join(sorted(unknown)))
+            positions = [position for position in PERFT_POSITIONS if position[0] in args.position]
+
+    if args.divide:
+        for backend in backends:
+            for name, fen, expected_counts in positions:
+                results = divide(new_position(backend, fen), args.divide)
+                print(backend, name, "divide", args.divide)
+                for notation, nodes in sorted(results):
+                    print(notation + ":", nodes)
+                print("moves:", len(results), "nodes:", sum(nodes for notation, nodes in results))
+        return 0
+
+    return 0 if run_suite(positions, args.depth, backends) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+UCI (Universal Chess Interface) front end, so the engine can run headless on a server or be driven by a tournament
+manager or GUI. Commands are read from stdin and answers written to stdout. The search runs on its own thread, the
+main thread keeps reading commands while it searches, so "stop" ends the search within a few milliseconds (the
+search checks for it every ChessAI.CHECK_LIMITS_EVERY nodes) and "isready" is answered straight away.
+
+Usage:
+    python uci.py
+Supported commands: uci, isready, ucinewgame, setoption (Hash, Threads), position startpos/fen ... moves ...,
+go depth/movetime/wtime/btime/winc/binc/movestogo/nodes/infinite, stop, quit
+"""
+import multiprocessing
+import sys
+import threading
+import time
+
+import ChessEngine
+import ChessAI
+
+ENGINE_NAME = "Chess-Engine"
+ENGINE_AUTHOR = "Navin2109"
+MAX_HASH_MB = 1024
+MOVES_TO_GO = 30  # moves the remaining clock time is shared between when the GUI doesn't say
+MOVE_OVERHEAD = 0.05  # seconds kept back per move for the answer to reach the GUI
+
+
+class UciEngine:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()  # info lines come from the search thread
+        self.gs = ChessEngine.GameState()
+        self.workers = 1
+        self.stop_event = threading.Event()
+        self.search_thread = None
+        self.search_start = 0
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    '''
+    Handle one line of input, returns False on quit
+    '''
+    def handle_command(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default %d min 1 max %d" % (ChessAI.HASH_SIZE_MB, MAX_HASH_MB))
+            self.send("option name Threads type spin default 1 min 1 max %d" % multiprocessing.cpu_count())
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop_search()
+            ChessAI.transposition_table.clear()
+        elif command == "setoption":
+            self.stop_search()
+            self.set_option(arguments)
+        elif command == "position":
+            self.stop_search()
+            self.set_position(arguments)
+        elif command == "go":
+            self.stop_search()
+            self.start_search(arguments)
+        elif command == "stop":
+            self.stop_search()
+        elif command == "quit":
+            self.stop_search()
+            return False
+        # anything else (debug, register, ponderhit, ...) is ignored, as the protocol asks
+        return True
+
+    '''
+    setoption name <name> value <value>
+    '''
+    def set_option(self, arguments):
+        if "name" not in arguments or "value" not in arguments:
+            return
+        name = " ".join(arguments[arguments.index("name") + 1:arguments.index("value")]).lower()
+        value = " ".join(arguments[arguments.index("value") + 1:])
+        try:
+            if name == "hash":
+                ChessAI.transposition_table.resize(min(max(int(value), 1), MAX_HASH_MB))
+            elif name == "threads":
+                self.workers = min(max(int(value), 1), multiprocessing.cpu_count())
+                if self.workers > 1:  # start the search processes now rather than in the first go's time
+                    ChessAI.get_search_pool(self.workers)
+        except ValueError:
+            self.send("info string invalid value " + value + " for option " + name)
+
+    '''
+    position startpos [moves ...] or position fen <fen> [moves ...]. After an invalid FEN there is no position until
+    the next valid position command, go answers bestmove 0000 meanwhile.
+    '''
+    def set_position(self, arguments):
+        moves_index = arguments.index("moves") if "moves" in arguments else len(arguments)
+        if arguments and arguments[0] == "fen":
+            try:
+                gs = ChessEngine.GameState(" ".join(arguments[1:moves_index]))
+            except (ValueError, KeyError, IndexError):
+                self.send("info string invalid fen " + " ".join(arguments[1:moves_index]))
+                self.gs = None
+                return
+        else:
+            gs = ChessEngine.GameState()
+        for notation in arguments[moves_index + 1:]:
+            for move in gs.get_valid_moves():
+                if move.get_chess_notations() == notation:
+                    gs.make_move(move)
+                    break
+            else:
+                self.send("info string illegal move " + notation)
+                break
+        self.gs = gs
+
+    '''
+    Start searching the current position on the search thread with the limits of the go command
+    '''
+    def start_search(self, arguments):
+        if self.gs is None:
+            self.send("bestmove 0000")
+            return
+        limits = {}
+        for i in range(len(arguments) - 1):
+            if arguments[i] in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "nodes"):
+                try:
+                    limits[arguments[i]] = int(arguments[i + 1])
+                except ValueError:
+                    pass
+        time_limit = None
+        if "movetime" in limits:
+            time_limit = limits["movetime"] / 1000
+        elif "wtime" in limits or "btime" in limits:
+            # an even share of the clock plus most of the increment
+            clock, increment = ("wtime", "winc") if self.gs.white_to_move else ("btime", "binc")
+            remaining = limits.get(clock, 0) / 1000
+            time_limit = remaining / limits.get("movestogo", MOVES_TO_GO) + limits.get(increment, 0) / 1000 * .8
+            time_limit = max(min(time_limit, remaining - MOVE_OVERHEAD), .01)
+        if time_limit is not None:
+            time_limit = max(time_limit - MOVE_OVERHEAD, .01)
+        max_depth = min(limits.get("depth", ChessAI.MAX_DEPTH), ChessAI.MAX_DEPTH)
+
+        self.stop_event.clear()
+        self.search_start = time.time()
+        self.search_thread = threading.Thread(target=self.search, args=(time_limit, limits.get("nodes"), max_depth,
+                                                                        "infinite" in arguments))
+        self.search_thread.start()
+
+    def search(self, time_limit, node_limit, max_depth, infinite):
+        valid_moves = self.gs.get_valid_moves()
+        best_move = None
+        if valid_moves:
+            best_move = ChessAI.find_best_move(self.gs, valid_moves, time_limit=time_limit, node_limit=node_limit,
+                                               max_depth=max_depth, stop_check=self.stop_event.is_set,
+                                               workers=self.workers, iteration_callback=self.send_info)
+            if best_move is None:  # stopped before the first iteration finished, or every move gets mated
+                best_move = valid_moves[0]
+        if infinite:  # the answer waits for stop even when the search ends early on a mate
+            self.stop_event.wait()
+        self.send("bestmove " + (best_move.get_chess_notations() if best_move is not None else "0000"))
+
+    '''
+    Report a finished iteration of the search
+    '''
+    def send_info(self, depth, best_move, score):
+        elapsed = max(time.time() - self.search_start, .001)
+        if abs(score) >= ChessAI.MATE_THRESHOLD:
+            # mate scores are CHECKMATE minus the plies to the mate, UCI counts moves
+            mate_in = (ChessAI.CHECKMATE - abs(score) + 1) // 2
+            score_text = "mate " + str(mate_in if score > 0 else -mate_in)
+        else:
+            score_text = "cp " + str(int(round(score * 100)))
+        pv = ChessAI.principal_variation(self.gs, depth) or ([best_move] if best_move is not None else [])
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" % (
+            depth, score_text, ChessAI.nodes, ChessAI.nodes / elapsed, elapsed * 1000,
+            " ".join(move.get_chess_notations() for move in pv)))
+
+    '''
+    Stop the running search, its bestmove is sent before this returns
+    '''
+    def stop_search(self):
+        if self.search_thread is not None:
+            self.stop_event.set()
+            self.search_thread.join()
+            self.search_thread = None
+
+
+def main():
+    engine = UciEngine()
+    while True:
+        line = sys.stdin.readline()
+        if not line or not engine.handle_command(line):
+            break
+    engine.stop_search()
+    ChessAI.close_search_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())